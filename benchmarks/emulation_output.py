@@ -0,0 +1,65 @@
+"""
+Benchmark of reading PEXO emulation tables: numpy.genfromtxt vs pexopy.table.
+
+Usage: python benchmarks/emulation_output.py [--rows 100000 1000000 10000000] [--columns 20] [--workers 4] [--genfromtxt-max 1000000]
+"""
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import time
+import argparse
+import tempfile
+import numpy as np
+
+from pexopy.table import read_table, load_table, sidecar_path
+
+
+def synthetic_table(path, rows, columns, block=10**6):
+    names = ["JDutc"] + ["col{}".format(i) for i in range(1, columns)]
+    with open(path, "w") as f:
+        f.write(" ".join(names) + "\n")
+        for start in range(0, rows, block):
+            n = min(block, rows - start)
+            data = np.random.rand(n, columns) * 1e3
+            data[:, 0] = 2450000 + np.arange(start, start + n) * 0.01
+            np.savetxt(f, data, fmt="%.12g")
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10**5, 10**6, 10**7])
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--genfromtxt-max", type=int, default=10**6, help="skip genfromtxt for larger tables, it takes minutes")
+    options = parser.parse_args()
+
+    print("{:>10} {:>12} {:>12} {:>12} {:>12} {:>9}".format("rows", "genfromtxt", "loadtxt", "workers", "sidecar", "speedup"))
+    with tempfile.TemporaryDirectory() as folder:
+        for rows in options.rows:
+            path = os.path.join(folder, "table-{}.txt".format(rows))
+            synthetic_table(path, rows, options.columns)
+
+            reference = float("nan")
+            if rows <= options.genfromtxt_max:
+                reference = timed(np.genfromtxt, path, names=True)
+
+            sequential = timed(read_table, path)
+            parallel = timed(read_table, path, workers=options.workers)
+            load_table(path) # writes the sidecar
+            mapped = timed(load_table, path)
+
+            print("{:>10} {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.4f}s {:>8.1f}x".format(
+                rows, reference, sequential, parallel, mapped, reference / sequential))
+
+            os.remove(path)
+            os.remove(sidecar_path(path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+pexopy benchmark suite, runs against the stub PEXO in benchmarks/stub (no R or PEXO needed).
+
+Usage:
+    python benchmarks/run.py [--quick] [--only CASE ...] [--output results.json]
+    python benchmarks/run.py --compare OLD.json NEW.json [--threshold 0.1]
+
+Results are saved to benchmarks/results/<git commit>.json by default, compare two of them to find regressions.
+"""
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from pexopy import Pexo, EmulationOutput, FitOutput, ParFile
+from pexopy.arguments import PexoArguments
+
+
+benchmarks_dir = os.path.dirname(os.path.abspath(__file__))
+stub_Rscript   = os.path.join(benchmarks_dir, "stub", "Rscript")
+stub_pexodir   = os.path.join(benchmarks_dir, "stub", "pexo")
+results_dir    = os.path.join(benchmarks_dir, "results")
+
+
+def measure(function, repeat=5):
+    """
+    Best wall time of `repeat` calls of `function`, seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def stub_pexo(**kwargs):
+    return Pexo(Rscript=stub_Rscript, pexodir=stub_pexodir, verbose=False, **kwargs)
+
+
+# CASES, each one returns a dictionary {benchmark name: seconds}
+
+def case_startup(quick):
+    """
+    `import pexopy` in a new interpreter, and setting up `Pexo` once the module is imported.
+    """
+    package_dir = os.path.join(benchmarks_dir, "..")
+
+    def import_pexopy():
+        subprocess.check_call([sys.executable, "-c", "import pexopy, sys; assert 'rpy2' not in sys.modules"], cwd=package_dir)
+
+    def python():
+        subprocess.check_call([sys.executable, "-c", "pass"])
+
+    return {
+        "startup/import": measure(import_pexopy) - measure(python),
+        "startup/setup": measure(lambda: stub_pexo()),
+    }
+
+
+def case_arguments(quick):
+    def construct():
+        for _ in range(100):
+            arguments = PexoArguments(dict(mode="emulate", primary="HD128621", ins="HARPS", time="2450000 2453000 10"))
+            arguments.clear_temp()
+
+    return {"arguments/100x": measure(construct)}
+
+
+def case_timefile(quick):
+    results = {}
+    for n in ([10**3, 10**5] if quick else [10**3, 10**5, 10**6]):
+        epochs = 2450000 + np.arange(n) * 0.01
+
+        def generate():
+            arguments = PexoArguments(dict(mode="emulate", primary="HD128621", time=epochs))
+            arguments.clear_temp()
+
+        results["timefile/{}".format(n)] = measure(generate, repeat=3)
+    return results
+
+
+def case_parfile(quick):
+    """
+    ParFiles of a sweep: 1000 built from dictionaries with 100 distinct parameter sets, and 1000 read from their files.
+    """
+    base = dict(RefType="refro", BinaryModel="kepler", epoch=2450000.5, ra=10.0, dec=-20.0, plx=100.0, P=5.0, e=0.1, I=30.0, SBscaling="true")
+    paths = [ParFile(dict(base, P=float(i))).path for i in range(100)]
+
+    def from_dicts():
+        for i in range(1000):
+            ParFile(dict(base, P=float(i % 100)))
+
+    def from_paths():
+        for i in range(1000):
+            ParFile(paths[i % 100])
+
+    return {
+        "parfile/dict/1000x": measure(from_dicts),
+        "parfile/path/1000x": measure(from_paths),
+    }
+
+
+def case_parse(quick):
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for n in ([10**4, 10**5] if quick else [10**4, 10**5, 10**6]):
+            path = os.path.join(folder, "table.txt")
+            subprocess.check_call([stub_Rscript, "pexo.R", "-m", "emulate", "-t", "1 {} 1".format(n), "-o", path])
+
+            results["parse/text/{}".format(n)] = measure(lambda: EmulationOutput(path, sidecar=False).contents, repeat=3)
+            EmulationOutput(path).contents # writes the sidecar
+            results["parse/sidecar/{}".format(n)] = measure(lambda: EmulationOutput(path).contents, repeat=3)
+            os.remove(path + ".npy")
+
+        for niter in ([10**4] if quick else [10**4, 10**6]):
+            path = os.path.join(folder, "fit.Robj")
+            subprocess.check_call([stub_Rscript, "pexo.R", "-m", "fit", "-N", str(niter), "-o", path])
+            results["parse/fit/{}".format(niter)] = measure(lambda: FitOutput.open(path, mmap=False).chain().sum(), repeat=3)
+
+    return results
+
+
+def case_end_to_end(quick):
+    results = {}
+    pexo = stub_pexo()
+    for n in ([100, 10**4] if quick else [100, 10**4, 10**5]):
+        for workers in [1, 2, 4]:
+            jobs = [dict(mode="emulate", primary="HD128621", time="{} {} 1".format(i, i + n - 1)) for i in range(8)]
+
+            def batch():
+                for result in pexo.run_many(jobs, max_workers=workers):
+                    if not result.ok:
+                        raise result.error
+                    result.output.contents
+                    os.remove(result.output.path)
+
+            seconds = measure(batch, repeat=2)
+            results["end_to_end/{}epochs/{}workers".format(n, workers)] = seconds / len(jobs)
+    return results
+
+
+def case_workers(quick):
+    """
+    Subprocess per run vs warm workers, with a simulated R startup time.
+    """
+    results = {}
+    os.environ["PEXOPY_STUB_STARTUP"] = "0.2"
+    try:
+        jobs = [dict(mode="emulate", primary="HD128621", time="{} {} 1".format(i, i + 99)) for i in range(8)]
+        for workers in [0, 2]:
+            with stub_pexo(workers=workers) as pexo:
+                def batch():
+                    for result in pexo.run_many(jobs, max_workers=2):
+                        if not result.ok:
+                            raise result.error
+                        os.remove(result.output.path)
+
+                seconds = measure(batch, repeat=2)
+            results["workers/{}warm".format(workers)] = seconds / len(jobs)
+    finally:
+        del os.environ["PEXOPY_STUB_STARTUP"]
+    return results
+
+
+cases = dict(
+    startup=case_startup,
+    arguments=case_arguments,
+    timefile=case_timefile,
+    parfile=case_parfile,
+    parse=case_parse,
+    end_to_end=case_end_to_end,
+    workers=case_workers,
+)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=benchmarks_dir).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(options):
+    revision = git_revision()
+    results = dict(
+        revision=revision,
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        cpus=os.cpu_count(),
+        benchmarks={},
+    )
+
+    for name in options.only or list(cases):
+        print("Running {}...".format(name))
+        for benchmark, seconds in cases[name](options.quick).items():
+            print("  {:<40} {:>10.4f}s".format(benchmark, seconds))
+            results["benchmarks"][benchmark] = seconds
+
+    output = options.output
+    if output is None:
+        os.makedirs(results_dir, exist_ok=True)
+        output = os.path.join(results_dir, "{}.json".format(revision))
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results saved to {}".format(output))
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print("{:<40} {:>10} {:>10} {:>8}".format("benchmark", old["revision"], new["revision"], "ratio"))
+    regressions = 0
+    for benchmark in sorted(set(old["benchmarks"]) & set(new["benchmarks"])):
+        ratio = new["benchmarks"][benchmark] / old["benchmarks"][benchmark]
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        print("{:<40} {:>9.4f}s {:>9.4f}s {:>7.2f}x{}".format(
+            benchmark, old["benchmarks"][benchmark], new["benchmarks"][benchmark], ratio, flag))
+
+    return 1 if regressions > 0 else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast check")
+    parser.add_argument("--only", nargs="+", choices=list(cases), help="run only these cases")
+    parser.add_argument("--output", help="path to save the results to")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative slowdown reported as a regression")
+    options = parser.parse_args()
+
+    if options.compare:
+        sys.exit(compare(options.compare[0], options.compare[1], options.threshold))
+    run(options)
+
+
+if __name__ == "__main__":
+    main()
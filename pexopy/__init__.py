@@ -1,10 +1,24 @@
 # main class
-from .pexo import Pexo
+from .pexo import Pexo, JobResult
 
 # helpers
 from .parfile import ParFile
 from .output import EmulationOutput, FitOutput
-from .struct import Struct
+from .multichain import MultiChainFit
+from .parstat import ParStat, stack_parstat
+from .collection import FitCollection
+from .asyncprocess import AsyncPexoProcess
+from .limits import ResourceLimits, PexoProcessError
+from .budget import CoreBudget
+from .cache import ResultCache
+from .sweep import Sweep
+from .metrics import RunStats, metrics
+from .struct import Struct, ArrayStruct
 
 # PEXO settings
 from .settings import *
+from .settings import _deprecated
+
+
+def __getattr__(name):
+    return _deprecated(__name__, name)
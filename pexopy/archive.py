@@ -0,0 +1,57 @@
+import zipfile
+import numpy as np
+
+
+def save_arrays(path, arrays, compress=True):
+    """
+    Save a dictionary of numpy `arrays` to a .npz file in `path` (the name is used as is).
+
+    Uncompressed archives can be memory-mapped with `load_array`.
+    """
+    save = np.savez_compressed if compress else np.savez
+    with open(path, "wb") as f:
+        save(f, **arrays)
+
+
+def array_names(path):
+    """
+    Names of the arrays in a .npz file.
+    """
+    with zipfile.ZipFile(path) as archive:
+        return [name[:-4] for name in archive.namelist() if name.endswith(".npy")]
+
+
+def load_array(path, name, mmap=True):
+    """
+    Read the array `name` from a .npz file in `path`.
+
+    If `mmap` is set and the array is stored without compression, it is memory-mapped (read-only) instead of being read into memory.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + ".npy")
+        if not mmap or info.compress_type != zipfile.ZIP_STORED:
+            with archive.open(info) as f:
+                return np.lib.format.read_array(f, allow_pickle=False)
+
+    with open(path, "rb") as f:
+        # local file header: 30 bytes, then the file name and the extra field of their own lengths
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length = int.from_bytes(header[26:28], "little")
+        extra_length = int.from_bytes(header[28:30], "little")
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+
+    if dtype.hasobject:
+        raise ValueError("Array '{}' contains Python objects and can't be memory-mapped.".format(name))
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+
+    order = "F" if fortran_order else "C"
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape, order=order)
@@ -1,10 +1,41 @@
 import os
-import numbers
+import time
+import shlex
+import numpy as np
 from collections.abc import Iterable
 
-from .uniquefilename import UniqueFile
+from .uniquefilename import UniqueFile, UniqueArrayFile
 from .parfile import ParFile
-from .settings import temp_storage
+from .tempstore import ScratchDir, janitor, evict
+
+
+def time_epochs(time):
+    """
+    Expands a normalised --time argument (a path to a timing file, or a "from to step" string) into a numpy array of epochs.
+
+    Returns a 1D array of JDs, or a 2D array (epoch, 2) for split JDs.
+    """
+    if os.path.isfile(time):
+        epochs = np.loadtxt(time, ndmin=2)
+        return epochs[:, 0] if epochs.shape[1] == 1 else epochs[:, :2]
+
+    start, stop, step = [float(x) for x in time.split()]
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1 # same as seq(from, to, by) in R
+    return start + np.arange(count) * step
+
+
+def _is_time_range(value):
+    """
+    Whether the string is in the "from to step" format.
+    """
+    s = value.split()
+    if len(s) != 3:
+        return False
+    try:
+        [float(x) for x in s]
+    except ValueError:
+        return False
+    return True
 
 
 class PexoArguments(object):
@@ -13,12 +44,18 @@ class PexoArguments(object):
     """
     def __init__(self, args_dict):
         self._list = {}
-        for key in args_dict:
-            argument = Argument(key, args_dict[key])
-            self._list[argument.key] = argument
-            self._list[argument.shortkey] = argument
-        
-        self._ensure_output_specified()
+        self.scratch = ScratchDir() # temp folder of this run
+        try:
+            for key in args_dict:
+                argument = Argument(key, args_dict[key], scratch=self.scratch)
+                self._list[argument.key] = argument
+                self._list[argument.shortkey] = argument
+
+            self._ensure_output_specified()
+            self.argv # normalises all the values now, e.g. writes the .tim and .par files
+        except Exception:
+            self.scratch.release() # files of the arguments that were valid
+            raise
 
 
     def _ensure_output_specified(self):
@@ -27,12 +64,28 @@ class PexoArguments(object):
             if self._list["mode"].value == "fit":
                 append = ".Robj"
 
-            filename = UniqueFile(str(self), append=append, create=False)
+            filename = UniqueFile(str(self), append=append, folder=self.scratch.path, create=False)
             argument = Argument("out", filename)
             self._list[argument.key] = argument
             self._list[argument.shortkey] = argument
 
 
+    @property
+    def file_time(self):
+        """
+        Time spent writing .tim and .par files for the arguments, seconds.
+        """
+        return sum(self._list[key].elapsed for key in ("t", "P") if key in self._list)
+
+
+    @property
+    def temp_files(self):
+        """
+        Paths of the temporary files created for the arguments.
+        """
+        return list(self.scratch.files)
+
+
     def __getattr__(self, property_name):
         if property_name not in self._list:
             return None
@@ -40,36 +93,37 @@ class PexoArguments(object):
 
 
     def  __str__(self):
-        output_string = ""
+        return "".join(" " + shlex.quote(x) for x in self.argv)
+
+
+    @property
+    def argv(self):
+        """
+        Arguments as a list of command line tokens, e.g. ["-m", "emulate", "-t", "2450000 2453000 10"].
+        """
+        argv = []
         for key in self._list:
             if len(key) == 1: # only use the short representations
-                output_string += " -{} {}".format(self._list[key].shortkey, self._list[key].value)
+                argv += ["-{}".format(key), self._list[key].token]
 
-        return output_string
+        return argv
 
 
     def clear_temp(self, nuke=False):
         """
-        Removes temporary file created by the argument handlers (e.g. timing files that are generated when an array is provided as a --tim argument).
+        Removes temporary files created by the argument handlers (e.g. timing files that are generated when an array is provided as a --tim argument).
 
-        nuke, bool: removes ALL files in the temp folder, whether creted by current instnce or not. Use with caution when running multiple instnces in parallel.
+        Files are shared between the runs with identical inputs, in this and other processes, a file is only removed when no run is using it.
+        A default output stays in the temp storage while this process is running. After it has exited, the next pexopy process using
+        the storage removes it, use `output.saveto()` or `out=` to keep it.
+
+        nuke, bool: also removes the temp files of crashed or finished processes and all the shared files that are not in use, see `pexopy.tempstore`
         """
-        if nuke:
-            tempfiles = [
-                f for f in os.listdir(temp_storage)
-                if os.path.isfile(os.path.join(temp_storage, f)) and f.startswith(Argument._temp_file_prefix)
-            ]
-        else:
-            tempfiles = []
-            args = [self._list[key] for key in self._list]
-            for key in self._list:
-                for tempfile in self._list[key]._temp_files:
-                    tempfiles.append(tempfile)
+        self.scratch.release()
 
-        for f in tempfiles:
-            path = os.path.join(temp_storage, f)
-            if os.path.isfile(path):
-                os.remove(path)
+        if nuke:
+            janitor()
+            evict(max_size=0)
 
 
 class Argument(object):
@@ -78,11 +132,12 @@ class Argument(object):
     """
     _temp_file_prefix = "pexopy-temp-"
 
-    def __init__(self, key, value):
+    def __init__(self, key, value, scratch=None):
         self._init_values = (key, value)
         self._normalised_value = None
+        self.elapsed = 0.0 # time spent normalising the value, seconds
         self._handler = self._argument_handler(key)
-        self._temp_files = []
+        self.scratch = ScratchDir() if scratch is None else scratch
 
 
     @property
@@ -96,9 +151,21 @@ class Argument(object):
     @property
     def value(self):
         if self._normalised_value is None:
+            start = time.perf_counter()
             self._normalised_value = self._handler["handler"](self._init_values[1])
+            self.elapsed = time.perf_counter() - start
         return self._normalised_value
 
+    @property
+    def token(self):
+        """
+        Normalised value as a single command line token.
+        """
+        value = self.value
+        if isinstance(value, (list, tuple)):
+            return " ".join(str(x) for x in value)
+        return str(value)
+
 
     # LIST OF ARGUMENTS
 
@@ -170,7 +237,7 @@ class Argument(object):
     def _normalise_argument_par(self, value):
         par = ParFile(value)
         if par.temporary: # file was generated from a dictionary
-            self._temp_files.append(par.path)
+            return self.scratch.link(lambda: par.path if os.path.isfile(par.path) else ParFile(par.contents).path)
 
         if os.path.isfile(par.path):
             return par.path
@@ -202,29 +269,26 @@ class Argument(object):
             # this is a path to a timing file
             return value
 
-        if isinstance(value, str) and value.replace(" ", "").isnumeric() and len(value.split(" ")) == 3:
+        if isinstance(value, str) and _is_time_range(value):
             # this is a "from to step" format
-            return f"\"{value}\""
+            return value
 
         if isinstance(value, tuple) and len(value) == 3:
             # this is a (from, to, step) format
-            return " ".join(value)
+            return " ".join(str(x) for x in value)
 
         if isinstance(value, Iterable):
-            # must be a list of JDs -- create a file and return a path
-            contents = ""
-            for jd in value:
-                if isinstance(jd, numbers.Number):
-                    contents += "{}\n".format(jd)
-                elif len(jd) == 2:
-                    contents += "{} {}\n".format(jd[0], jd[1])
-                else:
-                    raise ValueError("`tim` argument should be a list of numbers, a list of tuples of numbers, or a path to a .tim file")
-
-            path = UniqueFile(contents, prepend=Argument._temp_file_prefix, append=".tim")
-            self._temp_files.append(path)
-
-            return path
+            # must be a list of JDs or (JD, JD) pairs -- create a file and return a path
+            errormessage = "`tim` argument should be a list of numbers, a list of tuples of numbers, or a path to a .tim file"
+            try:
+                epochs = np.asarray(value if isinstance(value, np.ndarray) else list(value))
+            except ValueError: # ragged
+                raise ValueError(errormessage)
+
+            if epochs.dtype.kind not in "iuf" or not (epochs.ndim == 1 or (epochs.ndim == 2 and epochs.shape[1] == 2)):
+                raise ValueError(errormessage)
+
+            return self.scratch.link(lambda: UniqueArrayFile(epochs, prepend=Argument._temp_file_prefix, append=".tim"))
 
 
     def _normalise_argument_primary(self, value):
@@ -0,0 +1,136 @@
+import time
+from collections import deque
+
+from .metrics import RunStats, metrics
+from .limits import ResourceLimits, PexoProcessError, _kill_group
+
+
+class AsyncPexoProcess(object):
+    """
+    PEXO run in a child process driven by an asyncio event loop, see `Pexo.start_async`.
+
+    Iterate over `lines()` to follow PEXO stdout/stderr, `await wait()` to get the output, and `kill()` to stop the run.
+    PEXO runs in its own process group, `kill()` stops the R processes it has started too.
+    """
+    _eof = object()
+
+    def __init__(self, process, arguments, load_output, stats=None, limits=None):
+        import asyncio
+        self.arguments    = arguments
+        self.stats        = RunStats(arguments.mode) if stats is None else stats
+        self.limits       = ResourceLimits() if limits is None else limits
+        self.tail         = deque(maxlen=max(self.limits.tail, 0)) # last lines of the output for the errors
+        self._started     = time.perf_counter()
+        self._process     = process
+        self._load_output = load_output
+        self._lines       = asyncio.Queue()
+        self._readers     = [
+            asyncio.ensure_future(self._read(process.stdout, "stdout")),
+            asyncio.ensure_future(self._read(process.stderr, "stderr")),
+        ]
+        self._open_streams = len(self._readers)
+        self.timed_out     = False
+        self._timer        = None
+        if self.limits.timeout is not None:
+            self._timer = asyncio.get_running_loop().call_later(self.limits.timeout, self._expire)
+
+
+    @classmethod
+    async def start(cls, command, cwd, arguments, load_output, stats=None, limits=None):
+        """
+        Start the `command` (list of str) in `cwd` without a shell, with the `limits` (ResourceLimits).
+        """
+        import asyncio
+        from asyncio.subprocess import PIPE
+        limits = ResourceLimits() if limits is None else limits
+        process = await asyncio.create_subprocess_exec(*command, cwd=cwd, stdout=PIPE, stderr=PIPE,
+            start_new_session=True, preexec_fn=limits._preexec)
+        try:
+            if limits._preexec is None:
+                limits.apply(process.pid)
+        except BaseException:
+            _kill_group(process)
+            raise
+        return cls(process, arguments, load_output, stats, limits)
+
+
+    @property
+    def pid(self):
+        return self._process.pid
+
+
+    @property
+    def returncode(self):
+        return self._process.returncode
+
+
+    async def lines(self):
+        """
+        Asynchronous iterator over PEXO output, yields tuples (stream, line), where `stream` is either "stdout" or "stderr".
+        """
+        while self._open_streams > 0:
+            item = await self._lines.get()
+            if item is AsyncPexoProcess._eof:
+                self._open_streams -= 1
+            else:
+                yield item
+
+
+    async def wait(self):
+        """
+        Wait for PEXO to finish and return the output (EmulationOutput or FitOutput).
+
+        Cancelling the wait kills the PEXO process, exceeding the time limit kills it and raises `PexoProcessError`.
+        """
+        import asyncio
+        error = None
+        try:
+            await asyncio.gather(*self._readers)
+            rc = await self._process.wait()
+            self.stats.add("pexo", time.perf_counter() - self._started)
+
+            if self.timed_out:
+                raise PexoProcessError(rc, self.tail, timeout=self.limits.timeout)
+            if rc != 0:
+                raise PexoProcessError(rc, self.tail)
+
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._load_output, self.arguments, self.stats)
+
+        except BaseException as e:
+            error = e
+            if isinstance(e, asyncio.CancelledError):
+                self.kill()
+            raise
+
+        finally:
+            if self._timer is not None:
+                self._timer.cancel()
+            _kill_group(self._process) # R processes left behind by PEXO
+            self.arguments.clear_temp()
+            metrics.record_run(self.stats, error)
+
+
+    def kill(self):
+        """
+        Kill the PEXO process and the processes it has started, if they are still running.
+        """
+        if self._process.returncode is None:
+            _kill_group(self._process)
+
+
+    def _expire(self):
+        if self._process.returncode is None:
+            self.timed_out = True
+            self.kill()
+
+
+    async def _read(self, stream, name):
+        while True:
+            line = await stream.readline()
+            if not line:
+                break
+            line = line.decode("utf-8", "replace").rstrip("\n")
+            self.tail.append(line)
+            await self._lines.put((name, line))
+        await self._lines.put(AsyncPexoProcess._eof)
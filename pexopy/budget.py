@@ -0,0 +1,206 @@
+import os
+import json
+import time
+import uuid
+import threading
+
+from .settings import core_budget_storage
+from .tempstore import _is_running
+
+try:
+    import fcntl
+except ImportError: # not on Windows, the budget is only shared within the process there
+    fcntl = None
+
+
+class CoreBudget(object):
+    """
+    Machine-wide budget of CPU cores for PEXO runs, shared by all the Python processes using the same state file, see `Pexo(budget=...)`.
+
+    A run is admitted when the cores it needs (its `ncore` argument, 1 if not set) are free. Waiting runs are admitted in the order of
+    their priority (higher first) and then of their arrival, a run that needs more cores than are free holds back the runs behind it.
+    Reservations of processes that have exited are dropped.
+
+    `cores`, int: number of cores in the budget, the number of CPUs this process may run on by default
+
+    `path`, str: state file of the budget, `pexopy.core_budget_storage` by default, processes on the same machine with the same path share the budget
+
+    `pin`, bool: give every run its own CPUs and pin the PEXO process to them (Linux only)
+
+    `poll`, float: seconds between the admission checks of a waiting run
+    """
+    _lock = threading.Lock() # for the platforms without flock
+
+    def __init__(self, cores=None, path=None, pin=False, poll=0.1):
+        self.cpus  = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        self.cores = len(self.cpus) if cores is None else int(cores)
+        self.path  = core_budget_storage if path is None else path
+        self.pin   = pin and hasattr(os, "sched_setaffinity")
+        self.poll  = poll
+
+        if self.cores < 1:
+            raise ValueError("Core budget should have at least one core: {}".format(self.cores))
+        if self.pin and self.cores > len(self.cpus):
+            raise ValueError("Can't pin the runs to {} cores, only {} CPUs are available.".format(self.cores, len(self.cpus)))
+
+
+    def acquire(self, ncore=1, priority=0, timeout=None):
+        """
+        Wait until `ncore` cores are free and reserve them, returns a `CoreReservation` (use it in a `with` block or call its `release()`).
+
+        A run that needs more cores than the budget has gets all of them.
+
+        `priority`, int: runs with a higher priority are admitted first
+
+        `timeout`, float: seconds to wait, raises TimeoutError after that (None waits indefinitely)
+        """
+        ncore = min(int(ncore), self.cores)
+        token = "{}-{}".format(os.getpid(), uuid.uuid4().hex)
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self._state() as state:
+            state["waiting"][token] = dict(pid=os.getpid(), ncore=ncore, priority=priority, since=time.time())
+
+        try:
+            while True:
+                with self._state() as state:
+                    cpus = self._admit(state, token)
+                    if cpus is not None:
+                        return CoreReservation(self, token, ncore, cpus if self.pin else None)
+
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError("No {} free cores in the budget after {}s.".format(ncore, timeout))
+                time.sleep(self.poll)
+
+        except BaseException:
+            with self._state() as state:
+                state["waiting"].pop(token, None)
+            raise
+
+
+    def release(self, token):
+        with self._state() as state:
+            state["running"].pop(token, None)
+            state["waiting"].pop(token, None)
+
+
+    def status(self):
+        """
+        Dictionary with the number of `cores` in the budget, the number of cores `used` and the numbers of `running` and `waiting` runs.
+        """
+        with self._state() as state:
+            return dict(
+                cores=self.cores,
+                used=sum(job["ncore"] for job in state["running"].values()),
+                running=len(state["running"]),
+                waiting=len(state["waiting"]),
+            )
+
+
+    def _admit(self, state, token):
+        """
+        Moves the run `token` from waiting to running if it's its turn and there are enough free cores, returns its CPUs or None.
+        """
+        free = self.cores - sum(job["ncore"] for job in state["running"].values())
+        busy = set(cpu for job in state["running"].values() for cpu in job["cpus"])
+        queue = sorted(state["waiting"].items(), key=lambda item: (-item[1]["priority"], item[1]["since"], item[0]))
+
+        for other, job in queue:
+            if job["ncore"] > free:
+                return None
+            if other == token:
+                cpus = [cpu for cpu in self.cpus if cpu not in busy][:job["ncore"]] if self.pin else []
+                del state["waiting"][token]
+                state["running"][token] = dict(pid=job["pid"], ncore=job["ncore"], cpus=cpus)
+                return cpus
+            free -= job["ncore"] # admitted first, when it checks next time
+        return None
+
+
+    def _state(self):
+        return _BudgetState(self.path, CoreBudget._lock)
+
+
+
+class CoreReservation(object):
+    """
+    Cores reserved in a `CoreBudget` for a single run.
+
+    `ncore`, int: number of cores
+
+    `cpus`, list: CPUs to pin the run to, None if the budget does not pin the runs
+    """
+    def __init__(self, budget, token, ncore, cpus=None):
+        self.budget = budget
+        self.token  = token
+        self.ncore  = ncore
+        self.cpus   = cpus
+
+
+    def release(self):
+        if self.token is not None:
+            self.budget.release(self.token)
+            self.token = None
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+
+class _BudgetState(object):
+    """
+    Context manager reading the state of a budget from its file under an exclusive lock, and writing it back at the end of the block.
+    Reservations of processes that are not running any more are dropped.
+    """
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+        self.state = None
+
+
+    def __enter__(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+
+        self.lock.acquire()
+        try:
+            self._file = open(self.path + ".lock", "a")
+            if fcntl is not None:
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+
+            try:
+                with open(self.path) as f:
+                    self.state = json.load(f)
+            except (FileNotFoundError, ValueError): # first use, or a file cut short by a crash
+                self.state = {}
+        except BaseException:
+            self._unlock()
+            raise
+
+        for key in ("running", "waiting"):
+            jobs = self.state.setdefault(key, {})
+            for token in [token for token, job in jobs.items() if not _is_running(job["pid"])]:
+                del jobs[token]
+        return self.state
+
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            temp = "{}.{}.part".format(self.path, os.getpid())
+            with open(temp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(temp, self.path)
+        finally:
+            self._unlock()
+
+
+    def _unlock(self):
+        if getattr(self, "_file", None) is not None:
+            self._file.close() # releases the flock
+            self._file = None
+        self.lock.release()
@@ -0,0 +1,296 @@
+import os
+import time
+import shutil
+import hashlib
+import threading
+
+from .settings import cache_storage
+from .table import sidecar_path
+from .archive import save_arrays, load_array
+
+
+def pexo_revision(pexodir):
+    """
+    Returns a string identifying the PEXO code in `pexodir`: the git commit hash if it's a git repository, otherwise a hash of `code/pexo.R`.
+    """
+    git_dir = os.path.join(pexodir, ".git")
+    head_path = os.path.join(git_dir, "HEAD")
+    if os.path.isfile(head_path):
+        with open(head_path) as f:
+            head = f.read().strip()
+
+        if not head.startswith("ref:"): # detached HEAD
+            return head
+
+        ref = head[4:].strip()
+        ref_path = os.path.join(git_dir, ref)
+        if os.path.isfile(ref_path):
+            with open(ref_path) as f:
+                return f.read().strip()
+
+        packed_refs = os.path.join(git_dir, "packed-refs")
+        if os.path.isfile(packed_refs):
+            with open(packed_refs) as f:
+                for line in f:
+                    s = line.split()
+                    if len(s) == 2 and s[1] == ref:
+                        return s[0]
+
+    return "md5:" + _file_digest(os.path.join(pexodir, "code", "pexo.R"), hashlib.md5())
+
+
+def _file_digest(path, digest=None):
+    digest = hashlib.sha256() if digest is None else digest
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    """
+    Persistent on-disk cache of PEXO outputs, keyed by a fingerprint of the run (see `ResultCache.fingerprint`).
+
+    Least recently used entries are evicted when the cache grows over `max_size`, and entries that have not been used for `max_age` are dropped.
+
+    `folder`, str: cache directory, `cache_storage` from the settings by default
+
+    `max_size`, int: maximum total size of the cached outputs, bytes (None for no limit)
+
+    `max_age`, float: maximum time since the last use of an entry, seconds (None for no limit)
+    """
+    def __init__(self, folder=None, max_size=2**30, max_age=None):
+        self.folder   = cache_storage if folder is None else folder
+        self.max_size = max_size
+        self.max_age  = max_age
+
+        self.hits      = 0
+        self.misses    = 0
+        self.epoch_hits   = 0 # lookups of `get_epochs`, counted apart from the whole outputs
+        self.epoch_misses = 0
+        self.stores    = 0
+        self.evictions = 0
+        self._lock     = threading.Lock()
+
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+
+
+    @property
+    def stats(self):
+        """
+        Dictionary with the cache statistics of this instance.
+        """
+        lookups = self.hits + self.misses
+        epoch_lookups = self.epoch_hits + self.epoch_misses
+        entries = self._entries()
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups > 0 else 0.0,
+            epoch_hits=self.epoch_hits,
+            epoch_misses=self.epoch_misses,
+            epoch_hit_rate=self.epoch_hits / epoch_lookups if epoch_lookups > 0 else 0.0,
+            stores=self.stores,
+            evictions=self.evictions,
+            entries=len(entries),
+            size=sum(entry[2] for entry in entries),
+        )
+
+
+    def fingerprint(self, arguments, revision="", seed=None, epochs=True):
+        """
+        SHA-256 key for a run with the normalised `arguments` (PexoArguments) on PEXO `revision`, with the random `seed` if it is set.
+
+        All the arguments except the output path are used, --par and --time files are represented by their contents and --data directories by the names, sizes and modification times of the files in them.
+
+        `epochs`, bool: include the --time argument, without it the key is shared by all the runs that only differ in their epochs (see `get_epochs`)
+        """
+        digest = hashlib.sha256()
+        digest.update("revision {}\n".format(revision).encode("utf-8"))
+        if seed is not None:
+            digest.update("seed {}\n".format(int(seed)).encode("utf-8"))
+
+        argv = arguments.argv
+        pairs = sorted(zip(argv[0::2], argv[1::2]))
+        for key, value in pairs:
+            if key == "-o" or (key == "-t" and not epochs):
+                continue
+
+            if key in ("-P", "-t") and os.path.isfile(value):
+                value = "file:" + _file_digest(value)
+            elif key == "-d" and os.path.isdir(value):
+                value = "dir:" + self._directory_digest(value)
+
+            digest.update("{} {}\n".format(key, value).encode("utf-8"))
+
+        return digest.hexdigest()
+
+
+    def get(self, key, path, append=""):
+        """
+        Copies the cached output for the `key` to `path` and returns True, or returns False if it's not in the cache.
+
+        The binary copy of the table (see `table.load_table`) is restored as well if it has been cached.
+        """
+        cached = os.path.join(self.folder, key + append)
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(cached) > self.max_age:
+                self._remove(cached)
+                raise FileNotFoundError(cached)
+
+            shutil.copyfile(cached, path)
+            os.utime(cached) # mark as recently used
+            if self._copy_sidecar(sidecar_path(cached), sidecar_path(path)):
+                os.utime(sidecar_path(cached))
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+
+    def put(self, key, path, append=""):
+        """
+        Stores a copy of the output file in `path` under the `key`, together with its binary copy if there is one.
+        """
+        cached = os.path.join(self.folder, key + append)
+        partial = "{}.{}-{}.part".format(cached, os.getpid(), threading.get_ident())
+        shutil.copyfile(path, partial)
+        os.replace(partial, cached)
+        self._copy_sidecar(sidecar_path(path), sidecar_path(cached))
+
+        with self._lock:
+            self.stores += 1
+        self.evict()
+
+
+    def get_epochs(self, key):
+        """
+        Emulated epochs stored under the `key` (see `fingerprint(epochs=False)`), a tuple (epochs, table) or None if there are none.
+
+        `epochs` is a 2D array (epoch, 1 or 2) and `table` the structured array of the emulation with a row per epoch, both sorted by epoch.
+        """
+        cached = os.path.join(self.folder, key + ".epochs.npz")
+        try:
+            if self.max_age is not None and time.time() - os.path.getmtime(cached) > self.max_age:
+                self._remove(cached)
+                raise FileNotFoundError(cached)
+
+            epochs, table = load_array(cached, "epochs", mmap=False), load_array(cached, "table", mmap=False)
+            os.utime(cached) # mark as recently used
+        except (FileNotFoundError, KeyError, ValueError): # not cached, or written by an incompatible version
+            with self._lock:
+                self.epoch_misses += 1
+            return None
+
+        with self._lock:
+            self.epoch_hits += 1
+        return epochs, table
+
+
+    def put_epochs(self, key, epochs, table):
+        """
+        Stores the emulated `epochs` (2D array) with the `table` of their rows under the `key`, replacing the earlier ones.
+        """
+        cached = os.path.join(self.folder, key + ".epochs.npz")
+        partial = "{}.{}-{}.part".format(cached, os.getpid(), threading.get_ident())
+        save_arrays(partial, dict(epochs=epochs, table=table), compress=False)
+        os.replace(partial, cached)
+
+        with self._lock:
+            self.stores += 1
+        self.evict()
+
+
+    def evict(self):
+        """
+        Removes expired entries and the least recently used ones until the cache fits in `max_size`.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1]) # oldest first
+        now = time.time()
+        size = sum(entry[2] for entry in entries)
+
+        for path, mtime, nbytes in entries:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            oversized = self.max_size is not None and size > self.max_size
+            if not expired and not oversized:
+                continue
+
+            self._remove(path)
+            size -= nbytes
+
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        for path, _, _ in self._entries():
+            self._remove(path)
+
+
+    def _entries(self):
+        """
+        List of (path, modification time, size) of the entries, the binary copy of a table is counted in the size of its entry.
+        """
+        entries = {}
+        sidecars = {}
+        for f in os.listdir(self.folder):
+            if f.endswith(".part"):
+                continue
+            path = os.path.join(self.folder, f)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            (sidecars if f.endswith(".npy") else entries)[path] = [stat.st_mtime, stat.st_size]
+
+        for path, (mtime, size) in sidecars.items():
+            parent = path[:-len(".npy")]
+            if parent in entries:
+                entries[parent][1] += size
+            else: # left behind by a crash, an entry of its own so that it's evicted
+                entries[path] = [mtime, size]
+        return [(path, mtime, size) for path, (mtime, size) in entries.items()]
+
+
+    @staticmethod
+    def _copy_sidecar(source, destination):
+        """
+        Copies the binary copy of a table if there is one, returns True if it has been copied.
+        """
+        try:
+            shutil.copyfile(source, destination)
+        except FileNotFoundError:
+            return False
+        return True
+
+
+    def _remove(self, path):
+        if not path.endswith(".npy"):
+            try:
+                os.remove(sidecar_path(path))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+
+        with self._lock:
+            self.evictions += 1
+
+
+    @staticmethod
+    def _directory_digest(folder):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(folder):
+            dirs.sort()
+            for f in sorted(files):
+                stat = os.stat(os.path.join(root, f))
+                name = os.path.relpath(os.path.join(root, f), folder)
+                digest.update("{} {} {}\n".format(name, stat.st_size, stat.st_mtime_ns).encode("utf-8"))
+        return digest.hexdigest()
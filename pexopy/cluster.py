@@ -0,0 +1,405 @@
+"""
+Distributing PEXO runs over several machines: a `Coordinator` holds a queue of `Pexo.run` arguments,
+and `ClusterWorker`s on any host connect to it over TCP, pull jobs one at a time, run them with their local PEXO and send the outputs back.
+
+Start workers with
+    python -m pexopy.cluster HOST:PORT [--threads N]
+with the same $PEXOPY_CLUSTER_KEY as the coordinator (the connections are authenticated with it, never share it).
+"""
+import os
+import sys
+import time
+import uuid
+import pickle
+import argparse
+import threading
+from collections import deque
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from .pexo import JobResult
+from .output import EmulationOutput, FitOutput
+from .tempstore import ScratchDir, remove_output
+
+
+class Coordinator(object):
+    """
+    Queue of PEXO jobs for `ClusterWorker`s connecting over TCP.
+
+    Idle workers pull the next job, so faster workers take more of them. A worker sends heartbeats while it runs a job,
+    and a job is put back into the queue if its worker disconnects or misses the heartbeats for `timeout` seconds.
+
+    `address`, tuple: (host, port) to listen on, port 0 picks a free one (see `address` after the start)
+
+    `authkey`, bytes: shared secret of the coordinator and the workers, $PEXOPY_CLUSTER_KEY or a random one by default
+
+    `timeout`, float: seconds without a heartbeat after which a running job is given to another worker
+
+    `retries`, int: number of times a job is put back into the queue before it fails
+    """
+    def __init__(self, address=("localhost", 0), authkey=None, timeout=30, retries=2):
+        self.authkey  = _authkey(authkey, generate=True)
+        self.timeout  = timeout
+        self.retries  = retries
+        self.scratch  = ScratchDir() # fit outputs received from the workers
+
+        self._listener  = Listener(address, authkey=self.authkey)
+        self.address    = self._listener.address
+        self._condition = threading.Condition()
+        self._jobs      = {} # index -> dict(args, state, attempts, deadline)
+        self._queue     = deque() # indices of the jobs waiting for a worker
+        self._finished  = deque() # JobResult
+        self._pending   = 0 # jobs submitted and not finished
+        self._closed    = False
+
+        self._threads = [
+            threading.Thread(target=self._accept, daemon=True),
+            threading.Thread(target=self._monitor, daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+
+    def submit(self, args):
+        """
+        Add a job (dictionary of `Pexo.run` arguments) to the queue, returns its index.
+        """
+        with self._condition:
+            if self._closed:
+                raise ValueError("The coordinator is closed.")
+            index = len(self._jobs)
+            self._jobs[index] = dict(args=dict(args), state="queued", attempts=0, deadline=None)
+            self._queue.append(index)
+            self._pending += 1
+            self._condition.notify_all()
+        return index
+
+
+    def results(self):
+        """
+        Generator of `JobResult`s of the submitted jobs as they finish, until all of them are done.
+        """
+        while True:
+            with self._condition:
+                while len(self._finished) == 0 and self._pending > 0:
+                    self._condition.wait()
+                if len(self._finished) == 0:
+                    return
+                result = self._finished.popleft()
+            yield result
+
+
+    def run_many(self, jobs):
+        """
+        Submit the `jobs` and yield a `JobResult` for each of them as soon as it finishes, same as `Pexo.run_many`.
+        """
+        indices = [self.submit(args) for args in jobs]
+        wanted = set(indices)
+        for result in self.results():
+            if result.index in wanted:
+                yield result
+
+
+    def close(self):
+        """
+        Stop accepting workers, the connected ones are told to stop on their next request.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+
+        try: # wake up the accepting thread
+            Client(self.address, authkey=self.authkey).close()
+        except OSError:
+            pass
+        self._listener.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+    def _accept(self):
+        while True:
+            try:
+                connection = self._listener.accept()
+            except OSError: # closed, or a client that failed to authenticate
+                if self._closed:
+                    return
+                continue
+
+            if self._closed:
+                connection.close()
+                return
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+
+    def _serve(self, connection):
+        """
+        Talks to a single worker until it disconnects, then puts its unfinished jobs back into the queue.
+        """
+        leased = {} # job index -> attempt given to this worker
+        try:
+            while True:
+                message = connection.recv()
+                kind = message[0]
+
+                if kind == "request":
+                    job = self._next_job(wait=1.0)
+                    if job is not None:
+                        index, attempt, args = job
+                        leased[index] = attempt
+                        connection.send(("job", index, attempt, args))
+                    else:
+                        connection.send(("stop",) if self._closed else ("wait",))
+
+                elif kind == "heartbeat":
+                    self._renew(message[1], message[2])
+
+                elif kind in ("result", "error"):
+                    index, attempt = message[1], message[2]
+                    if leased.get(index) == attempt:
+                        del leased[index]
+                    if kind == "result":
+                        output = _unpack(message[3], self.scratch)
+                        if not self._finish(index, output=output) and getattr(output, "path", None) is not None:
+                            remove_output(output.path) # late duplicate of a finished job
+                    else:
+                        self._finish(index, error=message[3])
+
+        except (EOFError, OSError): # worker is gone
+            pass
+
+        finally:
+            connection.close()
+            for index, attempt in leased.items():
+                self._requeue(index, attempt, "the worker has disconnected")
+
+
+    def _next_job(self, wait):
+        """
+        Takes the next queued job, returns a tuple (index, attempt, args) or None if there is none after `wait` seconds.
+        """
+        deadline = time.monotonic() + wait
+        with self._condition:
+            while True:
+                while len(self._queue) > 0 and self._jobs[self._queue[0]]["state"] != "queued": # finished by a late result meanwhile
+                    self._queue.popleft()
+                if len(self._queue) > 0 or self._closed:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+            if len(self._queue) == 0:
+                return None
+
+            index = self._queue.popleft()
+            job = self._jobs[index]
+            job["state"] = "running"
+            job["attempts"] += 1
+            job["deadline"] = time.monotonic() + self.timeout
+            return index, job["attempts"], job["args"]
+
+
+    def _renew(self, index, attempt):
+        with self._condition:
+            job = self._jobs.get(index)
+            if job is not None and job["state"] == "running" and job["attempts"] == attempt: # not a stale worker of an earlier attempt
+                job["deadline"] = time.monotonic() + self.timeout
+
+
+    def _requeue(self, index, attempt, reason):
+        with self._condition:
+            job = self._jobs[index]
+            if job["state"] != "running" or job["attempts"] != attempt: # done, or given to another worker already
+                return
+            if job["attempts"] > self.retries:
+                error = ChildProcessError("Job {} failed after {} attempts, {}.".format(index, job["attempts"], reason))
+                self._finish(index, error=error)
+            else:
+                job["state"] = "queued"
+                self._queue.appendleft(index)
+                self._condition.notify_all()
+
+
+    def _finish(self, index, output=None, error=None):
+        with self._condition:
+            job = self._jobs.get(index)
+            if job is None or job["state"] == "done": # finished by another worker already
+                return False
+            job["state"] = "done"
+            self._pending -= 1
+            self._finished.append(JobResult(index, job["args"], output, error))
+            self._condition.notify_all()
+            return True
+
+
+    def _monitor(self):
+        """
+        Puts the jobs of the workers that stopped sending heartbeats back into the queue.
+        """
+        while not self._closed:
+            time.sleep(max(0.1, self.timeout / 4))
+            now = time.monotonic()
+            with self._condition:
+                expired = [(index, job["attempts"]) for index, job in self._jobs.items() if job["state"] == "running" and job["deadline"] < now]
+            for index, attempt in expired:
+                self._requeue(index, attempt, "no heartbeat for {}s".format(self.timeout))
+
+
+
+class ClusterWorker(object):
+    """
+    Worker connecting to a `Coordinator` at `address` (host, port), it runs the jobs one at a time until the coordinator stops.
+
+    `authkey`, bytes: shared secret of the coordinator, $PEXOPY_CLUSTER_KEY by default
+
+    `runner`, callable: function running a job from the dictionary of arguments, `Pexo(verbose=False).run` by default
+
+    `heartbeat`, float: seconds between the heartbeats sent while a job is running, should be well below the coordinator `timeout`
+    """
+    def __init__(self, address, authkey=None, runner=None, heartbeat=5):
+        self.address   = address
+        self.authkey   = _authkey(authkey)
+        self.runner    = runner
+        self.heartbeat = heartbeat
+        self.done      = 0 # number of jobs run
+        self._lock     = threading.Lock() # serialises sends of the job and heartbeat threads
+        self._connection = None
+
+
+    def run(self):
+        """
+        Connect and run jobs until the coordinator tells the worker to stop or disconnects.
+        """
+        if self.runner is None:
+            from .pexo import Pexo
+            self.runner = Pexo(verbose=False).run
+
+        self._connection = Client(self.address, authkey=self.authkey)
+        try:
+            while True:
+                self._send(("request",))
+                message = self._connection.recv()
+                if message[0] == "stop":
+                    return
+                if message[0] == "job":
+                    self._run_job(message[1], message[2], message[3])
+
+        except (EOFError, OSError): # coordinator is gone
+            pass
+
+        finally:
+            self._connection.close()
+
+
+    def _run_job(self, index, attempt, args):
+        stop = threading.Event()
+        beating = threading.Thread(target=self._beat, args=(index, attempt, stop), daemon=True)
+        beating.start()
+        try:
+            output = self.runner(**args)
+            reply = ("result", index, attempt, _pack(output))
+        except Exception as e:
+            reply = ("error", index, attempt, _picklable(e))
+        finally:
+            stop.set()
+            beating.join()
+
+        self._send(reply)
+        self.done += 1
+
+
+    def _beat(self, index, attempt, stop):
+        while not stop.wait(self.heartbeat):
+            try:
+                self._send(("heartbeat", index, attempt))
+            except (EOFError, OSError):
+                return
+
+
+    def _send(self, message):
+        with self._lock:
+            self._connection.send(message)
+
+
+
+def _authkey(authkey, generate=False):
+    if authkey is None and "PEXOPY_CLUSTER_KEY" in os.environ:
+        authkey = os.environ["PEXOPY_CLUSTER_KEY"]
+    if authkey is None and generate:
+        authkey = os.urandom(32)
+    if authkey is None:
+        raise ValueError("Cluster connections need an `authkey` or the $PEXOPY_CLUSTER_KEY environment variable.")
+    return authkey.encode("utf-8") if isinstance(authkey, str) else authkey
+
+
+def _pack(output):
+    """
+    Output of a job as plain data for sending, the files of the output are removed.
+    """
+    if isinstance(output, EmulationOutput):
+        table = np.array(output.contents) # copy, the table can be memory-mapped from a file
+        if output.path is not None:
+            remove_output(output.path)
+        return ("table", table)
+
+    if isinstance(output, FitOutput):
+        path = os.path.join(ScratchDir().path, "{}.npz".format(uuid.uuid4().hex))
+        output.export(path)
+        with open(path, "rb") as f:
+            contents = f.read()
+        remove_output(path)
+        if output.path is not None:
+            remove_output(output.path)
+        return ("fit", contents)
+
+    return ("object", output)
+
+
+def _unpack(payload, scratch):
+    kind, value = payload
+    if kind == "table":
+        return EmulationOutput.from_array(value)
+    if kind == "fit":
+        path = os.path.join(scratch.path, "{}.npz".format(uuid.uuid4().hex))
+        with open(path, "wb") as f:
+            f.write(value)
+        return FitOutput.open(path, mmap=False)
+    return value
+
+
+def _picklable(error):
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return ChildProcessError("{}: {}".format(type(error).__name__, error))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pexopy cluster worker, runs PEXO jobs of a pexopy.cluster.Coordinator")
+    parser.add_argument("address", help="HOST:PORT of the coordinator")
+    parser.add_argument("--threads", type=int, default=1, help="number of jobs to run at the same time")
+    options = parser.parse_args(argv)
+
+    host, port = options.address.rsplit(":", 1)
+    workers = [ClusterWorker((host, int(port))) for _ in range(options.threads)]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print("Done, {} jobs.".format(sum(worker.done for worker in workers)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
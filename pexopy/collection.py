@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .settings import cache_storage
+from .output import FitOutput
+from .parstat import stack_parstat
+from .uniquefilename import _write_atomically
+
+
+class FitCollection(object):
+    """
+    Many fits (PEXO .Robj outputs) loaded in parallel, see `FitCollection.from_paths`.
+
+    Every fit is converted once into an uncompressed export (see `FitOutput.export`) with the requested parts only,
+    and opened from it with numpy, so the collection itself never starts R.
+
+    `fits`, dict: FitOutput of every fit that was loaded, by path, in the order of the paths
+
+    `errors`, dict: error of every fit that could not be loaded, by path
+    """
+    _index_name = "index.json"
+    _index_version = 1
+
+    def __init__(self, fits, errors=None):
+        self.fits = dict(fits)
+        self.errors = {} if errors is None else dict(errors)
+
+
+    @classmethod
+    def from_paths(cls, paths, workers=None, parts=("ParStat", "mc", "model"), burn=0, thin=1, index=None):
+        """
+        Load the fits in `paths`, converting them in a pool of `workers` processes with an R interpreter each (number of CPUs by default).
+
+        Conversions are kept in an on-disk index, a fit that has not changed since (same size and modification time) is not converted again.
+        Fits that fail to load are left out, with their errors in `errors`.
+
+        `parts`, list: objects of the fits to load, some of "ParStat", "mc", "Data", "model"
+
+        `burn`, `thin`, int: samples of the Markov chains to keep, same as for `FitOutput.chain`
+
+        `index`, str: folder of the index and the conversions, `<cache_storage>/fits` by default
+        """
+        paths = [os.path.abspath(path) for path in paths]
+        parts = sorted(parts)
+        folder = os.path.join(cache_storage, "fits") if index is None else index
+        os.makedirs(folder, exist_ok=True)
+
+        entries = _read_index(folder)
+        options = dict(parts=parts, burn=burn, thin=thin)
+        errors = {}
+        convert = {}
+        for path in dict.fromkeys(paths):
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                errors[path] = e
+                continue
+
+            entry = dict(options, mtime=stat.st_mtime_ns, size=stat.st_size, file=_export_name(path))
+            if not _is_current(entries.get(path), entry, folder):
+                convert[path] = entry
+
+        if len(convert) > 0:
+            workers = min(workers or os.cpu_count() or 1, len(convert))
+            context = multiprocessing.get_context("spawn") # a fresh R in every worker, never a copy of the R of this process (mp_context needs Python 3.7)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = {
+                    path: executor.submit(_convert_fit, path, os.path.join(folder, entry["file"]), parts, burn, thin)
+                    for path, entry in convert.items()
+                }
+                for path, future in futures.items():
+                    try:
+                        error = future.result()
+                    except Exception as e: # the worker has crashed
+                        error = "{}: {}".format(type(e).__name__, e)
+                    if error is not None:
+                        errors[path] = ValueError("Can't load the fit {}: {}".format(path, error))
+
+            _update_index(folder, {path: entry for path, entry in convert.items() if path not in errors})
+            entries.update(convert)
+
+        fits = {}
+        for path in dict.fromkeys(paths):
+            if path in errors:
+                continue
+            try:
+                fits[path] = FitOutput.open(os.path.join(folder, entries[path]["file"]))
+            except (OSError, ValueError) as e: # removed or broken by another process in the meantime
+                errors[path] = e
+
+        return cls(fits, errors)
+
+
+    def __len__(self):
+        return len(self.fits)
+
+
+    def __iter__(self):
+        return iter(self.fits)
+
+
+    def __getitem__(self, path):
+        return self.fits[os.path.abspath(path)]
+
+
+    @property
+    def paths(self):
+        return list(self.fits)
+
+
+    def parstat(self, parameters=None, statistics=None):
+        """
+        ParStat of all the fits as a 3D array (fit, parameter, statistic), in the order of `paths`, see `stack_parstat`.
+        """
+        return stack_parstat(list(self.fits.values()), parameters=parameters, statistics=statistics)
+
+
+    def chains(self, params=None):
+        """
+        Markov chains of every fit as 2D arrays (sample, parameter), by path.
+        """
+        return {path: fit.chain(params=params) for path, fit in self.fits.items()}
+
+
+    def models(self):
+        """
+        Model tables of every fit, by path.
+        """
+        return {path: fit.model for path, fit in self.fits.items()}
+
+
+
+def _convert_fit(path, target, parts, burn, thin):
+    """
+    Runs in a worker process: exports the fit in `path` to `target`, returns None or the error message.
+    """
+    try:
+        fit = FitOutput(path)
+        partial = "{}.{}.part".format(target, os.getpid())
+        try:
+            fit.export(partial, compress=False, parts=parts, burn=burn, thin=thin)
+            os.replace(partial, target)
+        finally:
+            if os.path.isfile(partial):
+                os.remove(partial)
+    except Exception as e: # R errors can't always be sent back to the parent process
+        return "{}: {}".format(type(e).__name__, e)
+    return None
+
+
+def _export_name(path):
+    return "{}.npz".format(hashlib.md5(path.encode("utf-8")).hexdigest())
+
+
+def _is_current(entry, wanted, folder):
+    if entry is None or not os.path.isfile(os.path.join(folder, entry["file"])):
+        return False
+    return all(entry.get(key) == wanted[key] for key in ("mtime", "size", "burn", "thin")) and set(wanted["parts"]) <= set(entry["parts"])
+
+
+def _read_index(folder):
+    try:
+        with open(os.path.join(folder, FitCollection._index_name)) as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+    return index.get("fits", {}) if index.get("version") == FitCollection._index_version else {}
+
+
+def _update_index(folder, entries):
+    # read again right before writing, so that the entries added by other processes in the meantime are kept
+    index = _read_index(folder)
+    index.update(entries)
+    path = os.path.join(folder, FitCollection._index_name)
+    _write_atomically(path, lambda f: json.dump(dict(version=FitCollection._index_version, fits=index), f))
@@ -0,0 +1,63 @@
+import os
+import time
+import threading
+from rpy2.robjects import r, StrVector
+
+from .output import EmulationOutput, FitOutput
+
+
+_r_code = os.path.join(os.path.dirname(os.path.abspath(__file__)), "R", "embedded.R")
+
+
+class EmbeddedSession(object):
+    """
+    PEXO run in the R session embedded in this Python process by rpy2, see `Pexo(backend="embedded")`.
+
+    R and the packages PEXO uses are loaded once, and the output PEXO would write to the --out file is passed back as an R object instead.
+    There is one embedded R session per process, so the runs are executed one at a time.
+
+    `code_dir`, str: path to the PEXO code directory (with pexo.R)
+
+    `verbose`, bool: show PEXO output
+    """
+    _lock = threading.Lock() # shared by all the sessions, R is not thread safe
+    _env  = None
+
+    def __init__(self, code_dir, verbose=True):
+        self.code_dir = code_dir
+        self.verbose  = verbose
+
+        with EmbeddedSession._lock:
+            if EmbeddedSession._env is None:
+                env = r["new.env"]()
+                r["source"](_r_code, local=env)
+                EmbeddedSession._env = env
+
+
+    def run(self, argv, out, stats=None, seed=None):
+        """
+        Run PEXO with the command line arguments `argv` (list of str), the output is captured instead of being written to `out`.
+
+        `seed`, int: seed of the R random number generator, set before the run
+
+        Returns a tuple (exit status, output), output is an EmulationOutput or FitOutput kept in memory (`output.path` is None),
+        or None if PEXO has not produced one.
+        """
+        start = time.perf_counter()
+        with EmbeddedSession._lock:
+            options = dict(quiet=not self.verbose)
+            if seed is not None:
+                options["seed"] = int(seed)
+            result = EmbeddedSession._env["pexopy_run"](self.code_dir, StrVector(argv), out, **options)
+        if stats is not None:
+            stats.add("pexo", time.perf_counter() - start)
+
+        status = int(result.rx2("status")[0])
+        kind = str(result.rx2("type")[0])
+        value = result.rx2("value")
+
+        if status != 0 or kind == "none":
+            return status, None
+        if kind == "env":
+            return status, FitOutput.from_environment(value, stats=stats)
+        return status, EmulationOutput.from_r(value, stats=stats)
@@ -0,0 +1,52 @@
+"""
+Helpers of incremental emulation (`Pexo.run(incremental=True)`): emulations of the same target and settings are cached as a single
+table with the epochs of its rows, and a new --time grid only needs PEXO for the epochs that are not in it yet.
+"""
+import numpy as np
+
+
+def epoch_rows(epochs):
+    """
+    Epochs (1D array of JDs, or 2D (epoch, 2) for split JDs) as a contiguous 2D float array (epoch, 1 or 2).
+    """
+    epochs = np.asarray(epochs, dtype=np.float64)
+    return np.ascontiguousarray(epochs.reshape(len(epochs), -1))
+
+
+def match_epochs(known, wanted):
+    """
+    Finds the `wanted` epochs among the `known` ones (both from `epoch_rows`, with the same number of columns).
+
+    Returns the index of every wanted epoch in `known` and a boolean mask of the ones that were found (their index is meaningless otherwise).
+    Epochs are compared exactly, as they are read from the --time argument.
+    """
+    if len(known) == 0:
+        return np.zeros(len(wanted), dtype=np.intp), np.zeros(len(wanted), dtype=bool)
+
+    known_keys, wanted_keys = _keys(known), _keys(wanted)
+    sorter = np.argsort(known_keys)
+    position = np.minimum(np.searchsorted(known_keys, wanted_keys, sorter=sorter), len(known) - 1)
+    index = sorter[position]
+    return index, known_keys[index] == wanted_keys
+
+
+def merge_epochs(epochs, table, new_epochs=None, new_table=None):
+    """
+    Union of two tables of emulated epochs (rows of `table` are the `epochs`), sorted by epoch and without duplicates.
+
+    Returns the merged epochs and table, the tables should have the same columns.
+    """
+    if new_epochs is not None:
+        epochs = np.concatenate([epochs, new_epochs])
+        table = np.concatenate([table, new_table])
+
+    _, unique = np.unique(_keys(epochs), return_index=True)
+    epochs, table = epochs[unique], table[unique]
+
+    order = np.lexsort(epochs.T[::-1].tolist() + [epochs.sum(axis=1)]) # by the whole JD, then by its parts
+    return epochs[order], table[order]
+
+
+def _keys(epochs):
+    # rows as single opaque values, for exact comparisons of whole epochs
+    return epochs.view(np.dtype((np.void, epochs.dtype.itemsize * epochs.shape[1]))).ravel()
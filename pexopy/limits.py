@@ -0,0 +1,175 @@
+import os
+import sys
+import copy
+import signal
+import threading
+from collections import deque
+from subprocess import Popen, PIPE, STDOUT
+
+from .metrics import wait_with_rusage
+
+try:
+    import resource
+except ImportError: # not on Windows
+    resource = None
+
+
+class ResourceLimits(object):
+    """
+    Limits of a PEXO process, see `Pexo(limits=...)` and `Pexo.run(limits=...)`.
+
+    PEXO is started in its own process group, so that the R processes it starts (e.g. with `ncore`) are stopped together with it.
+
+    `timeout`, float: wall-clock time limit of the run, seconds
+
+    `memory`, int: address space limit of every R process, bytes
+
+    `cpu`, int: CPU time limit of every R process, seconds
+
+    `nice`, int: niceness increment of the R processes, e.g. 10 to give way to interactive work
+
+    `tail`, int: number of the last lines of PEXO output included in the error if the run fails
+
+    `cpus`, list: CPUs to pin the R processes to (Linux only), see `CoreBudget(pin=True)`
+    """
+    def __init__(self, timeout=None, memory=None, cpu=None, nice=None, tail=20, cpus=None):
+        self.timeout = timeout
+        self.memory  = memory
+        self.cpu     = cpu
+        self.nice    = nice
+        self.tail    = tail
+        self.cpus    = cpus
+
+        for name in ("timeout", "memory", "cpu"):
+            value = getattr(self, name)
+            if value is not None and value <= 0:
+                raise ValueError("Resource limit '{}' should be a positive number: {}".format(name, value))
+
+
+    def apply(self, pid=0):
+        """
+        Apply the limits to the process `pid` (0 is the current process), the processes it starts later inherit them.
+        """
+        if resource is not None:
+            set_limit = resource.setrlimit if pid == 0 or not hasattr(resource, "prlimit") else lambda *limit: resource.prlimit(pid, *limit)
+            if self.memory is not None:
+                set_limit(resource.RLIMIT_AS, (int(self.memory), int(self.memory)))
+            if self.cpu is not None:
+                set_limit(resource.RLIMIT_CPU, (int(self.cpu), int(self.cpu)))
+
+        if self.nice is not None and hasattr(os, "setpriority"):
+            os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, pid) + int(self.nice))
+
+        if self.cpus is not None and hasattr(os, "sched_setaffinity"):
+            os.sched_setaffinity(pid, self.cpus)
+
+
+    def pinned(self, cpus):
+        """
+        Copy of the limits with the processes pinned to the `cpus`.
+        """
+        limits = copy.copy(self)
+        limits.cpus = list(cpus)
+        return limits
+
+
+    @property
+    def _preexec(self):
+        # the limits are set from the parent with prlimit when possible, preexec_fn is not safe in a process with threads
+        if resource is not None and hasattr(resource, "prlimit"):
+            return None
+        if self.memory is None and self.cpu is None and self.nice is None and self.cpus is None:
+            return None
+        return self.apply
+
+
+
+class PexoProcessError(ChildProcessError):
+    """
+    PEXO process has failed or has been stopped after the time limit.
+
+    `returncode`, int: exit status, negative if the process was killed by a signal
+
+    `tail`, list: last lines of PEXO output
+
+    `timeout`, float: the time limit if the process has exceeded it, otherwise None
+    """
+    def __init__(self, returncode, tail=(), timeout=None):
+        self.returncode = returncode
+        self.tail = list(tail)
+        self.timeout = timeout
+
+        if timeout is not None:
+            message = "PEXO run was stopped after the time limit of {}s.".format(timeout)
+        else:
+            message = "Underlying PEXO code return non-zero exit status {}.".format(returncode)
+        if len(self.tail) > 0:
+            message += "\nLast lines of the output:\n" + "\n".join(self.tail)
+        super().__init__(message)
+
+
+    def __reduce__(self):
+        return (type(self), (self.returncode, self.tail, self.timeout))
+
+
+
+def run_process(command, cwd, limits=None, verbose=False):
+    """
+    Run `command` in its own process group with the `limits` (ResourceLimits), printing its output if `verbose`.
+
+    Returns a tuple (exit status, peak RSS in bytes or None, last lines of output, True if the time limit was exceeded).
+    The whole process group is killed when the time limit is exceeded, when waiting is interrupted, and after the process exits.
+    """
+    limits = ResourceLimits() if limits is None else limits
+    process = Popen(command, cwd=cwd, stdout=PIPE, stderr=STDOUT, start_new_session=True, preexec_fn=limits._preexec)
+    timed_out = threading.Event()
+    tail = deque(maxlen=max(limits.tail, 0))
+
+    reader = threading.Thread(target=_read_output, args=(process.stdout, tail, verbose), daemon=True)
+    reader.start()
+
+    def expire():
+        timed_out.set()
+        _kill_group(process)
+
+    timer = None
+    if limits.timeout is not None:
+        timer = threading.Timer(limits.timeout, expire)
+        timer.daemon = True
+        timer.start()
+
+    try:
+        if limits._preexec is None:
+            limits.apply(process.pid)
+        rc, peak_rss = wait_with_rusage(process)
+    except BaseException:
+        _kill_group(process)
+        process.wait()
+        raise
+    finally:
+        if timer is not None:
+            timer.cancel()
+        _kill_group(process) # R processes left behind by PEXO
+        reader.join()
+        process.stdout.close()
+
+    return rc, peak_rss, list(tail), timed_out.is_set()
+
+
+def _read_output(stream, tail, verbose):
+    for line in iter(stream.readline, b""):
+        line = line.decode("utf-8", "replace").rstrip("\n")
+        tail.append(line)
+        if verbose:
+            print(line)
+            sys.stdout.flush()
+
+
+def _kill_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    except AttributeError: # no process groups on Windows
+        if process.returncode is None:
+            process.kill()
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+
+class RunStats(object):
+    """
+    Timing and resource usage of a single PEXO run, available as `output.stats`.
+
+    `phases`: dictionary of durations in seconds, in the order the phases happened:
+    "arguments" (validation and normalisation), "files" (writing .tim/.par files), "cache" (fingerprint and lookup),
+    "queue" (waiting for free cores in a `CoreBudget`), "pexo" (the PEXO process: R startup and computation), "parse" (reading the output, recorded when the output is first read)
+
+    `peak_rss`: peak resident memory of the PEXO process, bytes (None if unknown, e.g. with warm workers)
+
+    `bytes_written`: size of the files produced for the run, i.e. temporary inputs and the PEXO output
+
+    `bytes_read`: number of bytes read by pexopy when loading the output
+
+    `record`: add the phases to the `pexopy_phase_seconds` histograms, False for the parts of another run (e.g. chunks of a split)
+    """
+    def __init__(self, mode=None, record=True):
+        self.mode          = mode
+        self.record        = record
+        self.phases        = {}
+        self.peak_rss      = None
+        self.bytes_written = 0
+        self.bytes_read    = 0
+        self.cached        = False
+
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+        if self.record:
+            metrics.observe("pexopy_phase_seconds", seconds, phase=phase)
+
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager adding the time spent in the block to the phase `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+
+    def as_dict(self):
+        return dict(
+            mode=self.mode,
+            phases=dict(self.phases),
+            total=self.total,
+            peak_rss=self.peak_rss,
+            bytes_written=self.bytes_written,
+            bytes_read=self.bytes_read,
+            cached=self.cached,
+        )
+
+
+    def __repr__(self):
+        phases = ", ".join("{}={:.3f}s".format(name, seconds) for name, seconds in self.phases.items())
+        return "RunStats({})".format(phases)
+
+
+
+class MetricsRegistry(object):
+    """
+    Process-wide counters and histograms of PEXO runs (see `pexopy.metrics`), that can be written to a file in Prometheus text format or as JSON.
+    """
+    buckets = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 1800, float("inf")) # seconds
+
+    def __init__(self):
+        self._lock       = threading.Lock()
+        self._counters   = {}
+        self._histograms = {}
+
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increase the counter `name` with the given labels by `value`.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+
+    def observe(self, name, value, **labels):
+        """
+        Add `value` to the histogram `name` with the given labels.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = dict(counts=[0] * len(self.buckets), sum=0.0, count=0)
+            histogram = self._histograms[key]
+            histogram["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+
+    def record_run(self, stats, error=None):
+        """
+        Update the standard metrics with a finished run.
+        """
+        mode = stats.mode or "unknown"
+        status = "ok" if error is None else "error"
+        self.inc("pexopy_runs_total", mode=mode, status=status)
+        if error is not None:
+            self.inc("pexopy_run_failures_total", mode=mode, error=type(error).__name__)
+        self.observe("pexopy_run_seconds", stats.total, mode=mode)
+
+
+    def reset(self):
+        with self._lock:
+            self._counters   = {}
+            self._histograms = {}
+
+
+    def to_json(self):
+        """
+        Metrics as a JSON-serialisable dictionary.
+        """
+        with self._lock:
+            counters = [dict(name=name, labels=dict(labels), value=value) for (name, labels), value in sorted(self._counters.items())]
+            histograms = [
+                dict(name=name, labels=dict(labels), buckets=list(self.buckets), counts=list(h["counts"]), sum=h["sum"], count=h["count"])
+                for (name, labels), h in sorted(self._histograms.items())
+            ]
+        return dict(counters=counters, histograms=histograms)
+
+
+    def to_prometheus(self):
+        """
+        Metrics in Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(set(name for name, _ in self._counters)):
+                lines.append("# TYPE {} counter".format(name))
+                for (key, labels), value in sorted(self._counters.items()):
+                    if key == name:
+                        lines.append("{}{} {}".format(name, _labels(labels), value))
+
+            for name in sorted(set(name for name, _ in self._histograms)):
+                lines.append("# TYPE {} histogram".format(name))
+                for (key, labels), h in sorted(self._histograms.items()):
+                    if key != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, h["counts"]):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(float(bound))
+                        lines.append("{}_bucket{} {}".format(name, _labels(labels + (("le", le),)), cumulative))
+                    lines.append("{}_sum{} {}".format(name, _labels(labels), h["sum"]))
+                    lines.append("{}_count{} {}".format(name, _labels(labels), h["count"]))
+
+        return "\n".join(lines) + "\n"
+
+
+    def dump(self, path, format="prometheus"):
+        """
+        Write the metrics to `path` (atomically), `format` is "prometheus" or "json".
+        """
+        if format == "prometheus":
+            text = self.to_prometheus()
+        elif format == "json":
+            text = json.dumps(self.to_json(), indent=2)
+        else:
+            raise ValueError("Unknown metrics format: {}".format(format))
+
+        partial = "{}.{}.part".format(path, os.getpid())
+        with open(partial, "w") as f:
+            f.write(text)
+        os.replace(partial, path)
+
+
+
+def _labels(labels):
+    if len(labels) == 0:
+        return ""
+    escaped = ['{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels]
+    return "{" + ",".join(escaped) + "}"
+
+
+def wait_with_rusage(process):
+    """
+    Wait for a `subprocess.Popen` process to finish, returns (exit status, peak RSS in bytes or None).
+    """
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+
+    try:
+        _, status, usage = os.wait4(process.pid, 0)
+    except ChildProcessError: # already reaped
+        return process.wait(), None
+
+    if os.WIFSIGNALED(status):
+        process.returncode = -os.WTERMSIG(status)
+    else:
+        process.returncode = os.WEXITSTATUS(status)
+
+    scale = 1 if os.uname().sysname == "Darwin" else 1024 # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return process.returncode, usage.ru_maxrss * scale
+
+
+metrics = MetricsRegistry()
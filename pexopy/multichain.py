@@ -0,0 +1,172 @@
+import numpy as np
+
+from .struct import Struct
+
+
+class MultiChainFit(object):
+    """
+    Independent fits of the same model (see `Pexo.fit_multichain`), with their Markov chains merged.
+
+    `fits[i]` (or `output[i]`) is the FitOutput of the i-th chain, `seeds[i]` its random seed.
+    `chain()` and `summary()` work like the ones of FitOutput on all the chains at once, `chains()` keeps them apart.
+
+    `fits`, list: FitOutput of every chain, with the same parameters
+
+    `seeds`, list: random seeds of the chains
+    """
+    def __init__(self, fits, seeds=None):
+        if len(fits) == 0:
+            raise ValueError("MultiChainFit needs at least one fit.")
+
+        parameters = fits[0].parameters
+        for fit in fits[1:]:
+            if fit.parameters != parameters:
+                raise ValueError("All the chains should fit the same parameters.")
+
+        self.fits = list(fits)
+        self.seeds = list(seeds) if seeds is not None else [None] * len(fits)
+
+
+    def __len__(self):
+        return len(self.fits)
+
+
+    def __getitem__(self, index):
+        return self.fits[index]
+
+
+    @property
+    def parameters(self):
+        return self.fits[0].parameters
+
+
+    @property
+    def data(self):
+        return self.fits[0].data
+
+
+    @property
+    def mc(self):
+        """
+        Merged Markov chains of the parameters (all the chains one after another).
+        """
+        samples = self.chain()
+        return Struct({name: samples[:, i] for i, name in enumerate(self.parameters)})
+
+
+    def chains(self, burn=0, thin=1, params=None):
+        """
+        Markov chains as a 3D numpy array (chain, sample, parameter), arguments are the same as for `FitOutput.chain`.
+
+        Chains of different lengths are cut to the shortest one.
+        """
+        samples = [fit.chain(burn=burn, thin=thin, params=params) for fit in self.fits]
+        length = min(len(chain) for chain in samples)
+        return np.stack([chain[:length] for chain in samples])
+
+
+    def chain(self, burn=0, thin=1, params=None):
+        """
+        Merged Markov chains as a 2D numpy array (sample, parameter), arguments are the same as for `FitOutput.chain`.
+        """
+        samples = self.chains(burn=burn, thin=thin, params=params)
+        return samples.reshape(-1, samples.shape[2])
+
+
+    def rhat(self, burn=0, thin=1, params=None):
+        """
+        Split R-hat of every parameter, see `split_rhat`.
+        """
+        return split_rhat(self.chains(burn=burn, thin=thin, params=params))
+
+
+    def ess(self, burn=0, thin=1, params=None):
+        """
+        Effective sample size of every parameter, see `effective_sample_size`.
+        """
+        return effective_sample_size(self.chains(burn=burn, thin=thin, params=params))
+
+
+    def summary(self, burn=0, thin=1, params=None):
+        """
+        Posterior summaries of the merged chains, same as `FitOutput.summary` with the convergence diagnostics `rhat` and `ess` added.
+        """
+        samples = self.chains(burn=burn, thin=thin, params=params)
+        merged = samples.reshape(-1, samples.shape[2])
+        percentiles = np.percentile(merged, [1, 10, 50, 90, 99], axis=0)
+
+        return Struct(dict(
+            parameters=self.parameters if params is None else list(params),
+            mean=merged.mean(axis=0),
+            sd=merged.std(axis=0, ddof=1),
+            median=percentiles[2],
+            x1per=percentiles[0],
+            x10per=percentiles[1],
+            x90per=percentiles[3],
+            x99per=percentiles[4],
+            rhat=split_rhat(samples),
+            ess=effective_sample_size(samples),
+        ))
+
+
+    def converged(self, rhat=1.01, ess=None, burn=0, thin=1):
+        """
+        Whether the split R-hat of all the parameters is below `rhat` and, if `ess` is set, their effective sample sizes are above it.
+        """
+        samples = self.chains(burn=burn, thin=thin)
+        if len(self.fits) < 2:
+            return False
+        if not np.all(split_rhat(samples) < rhat):
+            return False
+        return ess is None or bool(np.all(effective_sample_size(samples) >= ess))
+
+
+
+def split_rhat(samples):
+    """
+    Potential scale reduction factor (Gelman et al., Bayesian Data Analysis, 3rd ed.) of every parameter,
+    from `samples` of shape (chain, sample, parameter). Every chain is split in halves, values close to 1 mean the chains have converged.
+    """
+    samples = np.asarray(samples)
+    half = samples.shape[1] // 2
+    if half < 2:
+        return np.full(samples.shape[2], np.nan)
+
+    split = np.concatenate([samples[:, :half], samples[:, samples.shape[1] - half:]]) # (2 * chain, half, parameter)
+    between = half * split.mean(axis=1).var(axis=0, ddof=1)
+    within = split.var(axis=1, ddof=1).mean(axis=0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.sqrt(((half - 1) / half * within + between / half) / within)
+
+
+def effective_sample_size(samples):
+    """
+    Effective sample size of every parameter from `samples` of shape (chain, sample, parameter),
+    using the autocorrelations of all the chains (computed with FFT) and Geyer's initial monotone sequence.
+    """
+    samples = np.asarray(samples, dtype=float)
+    nchains, n, _ = samples.shape
+    if n < 4:
+        return np.full(samples.shape[2], np.nan)
+
+    centered = samples - samples.mean(axis=1, keepdims=True)
+    size = 2 ** int(np.ceil(np.log2(2 * n)))
+    spectrum = np.fft.rfft(centered, size, axis=1)
+    autocovariance = np.fft.irfft(spectrum * np.conj(spectrum), size, axis=1)[:, :n] / n # (chain, lag, parameter)
+
+    within = autocovariance[:, 0].mean(axis=0) * n / (n - 1)
+    between = n * samples.mean(axis=1).var(axis=0, ddof=1) if nchains > 1 else 0.0
+    variance = (n - 1) / n * within + between / n
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rho = 1 - (within - autocovariance.mean(axis=0)) / variance # (lag, parameter)
+        rho[0] = 1
+
+        # sums of consecutive pairs of autocorrelations, cut at the first negative one and made monotone
+        pairs = rho[:n - n % 2].reshape(n // 2, 2, -1).sum(axis=1)
+        positive = np.cumprod(pairs > 0, axis=0).astype(bool)
+        pairs = np.minimum.accumulate(np.where(positive, pairs, 0), axis=0)
+
+        tau = -1 + 2 * pairs.sum(axis=0)
+        return nchains * n / tau
@@ -1,27 +1,155 @@
-from numpy import genfromtxt, array, asarray
-from rpy2.robjects import r
-from rpy2.rinterface import NARealType
+from numpy import asarray, ascontiguousarray, frombuffer, empty, where, percentile, nan, float64
 from shutil import move
+import time
 import os
 
 from .struct import Struct
+from .parstat import ParStat
+from .table import load_table, iter_table, write_table, read_header, column_names, sidecar_path
+from .archive import save_arrays, load_array, array_names
+
+
+_na_integer = -2**31 # NA_integer_ and NA (logical) in R
 
 
 class EmulationOutput(object):
     """
     Read PEXO emulation output file (.txt) from the specified `path`.
+
+    The table is read on the first access to `contents`, single columns are read on their own with `output["column"]`.
+
+    `sidecar`, bool: keep a binary copy of the table next to the file (`path` + ".npy") and memory-map it on the next loads instead of parsing the text
+
+    `workers`, int: number of processes to parse the text with
+
+    `columns`, list: names of the columns to read, all of them by default
+
+    `dtype`, numpy dtype: type of the columns, e.g. numpy.float32 for a quick look, float64 by default
+
+    `stats`, RunStats: timings of the run that produced the output, set by `Pexo.run`
     """
-    def __init__(self, path):
+    def __init__(self, path, sidecar=True, workers=1, columns=None, dtype=None, stats=None):
         if not os.path.isfile(path):
             errormessage = "PEXO output not found in the specified path: {}".format(path)
             raise FileNotFoundError(errormessage)
         
         self.path = path
-        self.contents = genfromtxt(path, names=True)
+        self.stats = stats
+        self.sidecar = sidecar
+        self.workers = workers
+        self.columns = None if columns is None else list(columns)
+        self.dtype = dtype
+
+        self._contents = None
+        self._column_cache = {}
+
+
+    @classmethod
+    def from_array(cls, table, stats=None):
+        """
+        Emulation output kept in memory, from a numpy structured array `table` (one field per column).
+
+        Its `path` is None until it is saved with `saveto`.
+        """
+        output = cls.__new__(cls)
+        output.path = None
+        output.stats = stats
+        output.sidecar = True
+        output.workers = 1
+        output.columns = None
+        output.dtype = None
+        output._contents = table
+        output._column_cache = {}
+        return output
+
+
+    @classmethod
+    def from_r(cls, r_table, stats=None):
+        """
+        Emulation output kept in memory, from the R data frame or matrix with the table, see `from_array`.
+        """
+        start = time.perf_counter()
+        r = _r()
+        names = column_names(r.colnames(r_table))
+        if r["is.data.frame"](r_table)[0]:
+            columns = [_r_vector_to_array(column) for column in r_table]
+        else:
+            columns = _r_matrix_columns(r_table)
+
+        table = empty(int(r.nrow(r_table)[0]), dtype=[(name, float64) for name in names])
+        for name, column in zip(names, columns):
+            table[name] = column
+
+        if stats is not None:
+            stats.add("parse", time.perf_counter() - start)
+        return cls.from_array(table, stats=stats)
+
+
+    @property
+    def contents(self):
+        if self._contents is None:
+            start = time.perf_counter()
+            self._contents = load_table(self.path, sidecar=self.sidecar, workers=self.workers, columns=self.columns, dtype=self.dtype)
+            self._column_cache = {}
+
+            if self.stats is not None:
+                self.stats.add("parse", time.perf_counter() - start)
+                source = getattr(self._contents, "filename", None) or self.path
+                self.stats.bytes_read += os.path.getsize(source)
+
+        return self._contents
+
+
+    @property
+    def names(self):
+        """
+        Names of the columns available in this output.
+        """
+        if self.columns is not None:
+            return list(self.columns)
+        if self.path is None:
+            return list(self._contents.dtype.names)
+        return read_header(self.path)
+
+
+    def __getitem__(self, name):
+        """
+        A single column of the table, read on its own if the whole table hasn't been read yet.
+        """
+        if self.columns is not None and name not in self.columns:
+            raise KeyError("Column '{}' was not selected for this output.".format(name))
+
+        if self._contents is not None:
+            return self._contents[name]
+
+        if name not in self._column_cache:
+            table = load_table(self.path, sidecar=self.sidecar, workers=self.workers, columns=[name], dtype=self.dtype)
+            self._column_cache[name] = table[name]
+
+        return self._column_cache[name]
+
+
+    def iter_chunks(self, n):
+        """
+        Generator of consecutive blocks of `n` rows of the table (numpy structured arrays), for going through large outputs without keeping them in memory.
+        """
+        if self.path is None:
+            if n < 1:
+                raise ValueError("Number of rows in a block should be a positive number.")
+            return (self._contents[start:start + n] for start in range(0, len(self._contents), n))
+        return iter_table(self.path, n, sidecar=self.sidecar, columns=self.columns, dtype=self.dtype)
 
 
     def saveto(self, path):
+        if self.path is None: # kept in memory
+            write_table(path, self._contents, sidecar=self.sidecar)
+            self.path = path
+            return
+
+        binary = sidecar_path(self.path)
         move(self.path, path)
+        if os.path.isfile(binary):
+            move(binary, sidecar_path(path))
         self.path = path
 
 
@@ -29,62 +157,293 @@ class EmulationOutput(object):
 class FitOutput(object):
     """
     Read PEXO fit output file (.Robj) from the specified `path`.
+
+    The file is loaded into its own R environment (`contents`), so several fits can be open at the same time.
+    The properties are converted to numpy on the first access and reused after that.
+
+    Use `FitOutput.open` to read a fit exported with `FitOutput.export` without R.
     """
-    def __init__(self, path):
+    _parstat_properties = ParStat.statistics
+    _matrices = ["ParStat", "mc"]
+    _data_frames = ["Data", "model"]
+    _export_format = 1
+
+    def __init__(self, path, stats=None):
         if not os.path.isfile(path):
             errormessage = "PEXO output not found in the specified path: {}".format(path)
             raise FileNotFoundError(errormessage)
 
         self.path = path
-        self.contents = r.load(path)
+        self.stats = stats
+        start = time.perf_counter()
+        r = _r()
+        self.contents = r["new.env"]()
+        r["load"](path, envir=self.contents)
+        self._converted = {}
+
+        if stats is not None:
+            stats.add("parse", time.perf_counter() - start)
+            stats.bytes_read += os.path.getsize(path)
+
+
+    @classmethod
+    def from_environment(cls, environment, stats=None):
+        """
+        Fit kept in memory, from the R environment with its objects (ParStat, mc, ...).
+
+        Its `path` is None until it is saved with `saveto`.
+        """
+        fit = cls.__new__(cls)
+        fit.path = None
+        fit.stats = stats
+        fit.contents = environment
+        fit._converted = {}
+        return fit
+
+
+    @classmethod
+    def open(cls, path, mmap=True):
+        """
+        Read a fit exported with `FitOutput.export` from `path`, only numpy is used for this.
+
+        `mmap`, bool: memory-map the arrays of uncompressed exports instead of reading them
+        """
+        if not os.path.isfile(path):
+            errormessage = "Exported fit not found in the specified path: {}".format(path)
+            raise FileNotFoundError(errormessage)
+
+        fit = cls.__new__(cls)
+        fit.path = path
+        fit.stats = None
+        fit.contents = None
+        fit._converted = {}
+        fit._mmap = mmap
+
+        if "format" not in array_names(path) or int(load_array(path, "format", mmap=False)) > FitOutput._export_format:
+            raise ValueError("File is not a supported PEXOpy fit export: {}".format(path))
+
+        return fit
+
+
+    def export(self, path, compress=True, parts=None, burn=0, thin=1):
+        """
+        Save ParStat, mc, Data and model of the fit to a .npz file in `path`, that can be read without R with `FitOutput.open`.
+
+        `compress`, bool: compress the arrays; uncompressed files are larger but can be memory-mapped when opened
+
+        `parts`, list: names of the objects to save, e.g. ["ParStat", "model"], all of them by default
+
+        `burn`, `thin`, int: samples of the Markov chains to save, same as for `chain()`
+        """
+        parts = FitOutput._matrices + FitOutput._data_frames if parts is None else list(parts)
+        unknown = [name for name in parts if name not in FitOutput._matrices + FitOutput._data_frames]
+        if len(unknown) > 0:
+            raise ValueError("Unknown parts of a fit: {}, should be some of: {}".format(", ".join(unknown), ", ".join(FitOutput._matrices + FitOutput._data_frames)))
+        if burn < 0 or thin < 1:
+            raise ValueError("`burn` should be non-negative and `thin` positive.")
+
+        arrays = dict(format=asarray(FitOutput._export_format))
+        for name in parts:
+            try:
+                names, values = self._raw(name)
+            except KeyError: # not in this fit
+                continue
+
+            arrays[name + "/names"] = asarray(names, dtype=str)
+            if name == "mc":
+                arrays[name + "/values"] = ascontiguousarray(values[:, burn::thin])
+            elif name in FitOutput._matrices:
+                arrays[name + "/values"] = ascontiguousarray(values)
+            else:
+                for i, column in enumerate(values):
+                    arrays["{}/{}".format(name, i)] = column.astype(str) if column.dtype.hasobject else column
+
+        save_arrays(path, arrays, compress=compress)
 
 
     def saveto(self, path):
-        move(self.path, path)
+        if self.path is None: # kept in memory
+            r = _r()
+            r["save"](list=r["ls"](self.contents), file=path, envir=self.contents)
+        else:
+            move(self.path, path)
         self.path = path
 
 
     @property
     def parstat(self):
-        obj  = array(r['ParStat']).T
-        colnames = r.colnames(obj)
-        properties = ["xopt", "x1per", "x99per", "x10per", "x90per", "xminus", "xplus", "mode", "mean", "sd", "skewness", "kurtosis"]
-
-        parameter_values = [dict(zip(properties, obj[i])) for i in range(len(colnames))]
-        return Struct(dict(zip(colnames, parameter_values)))
+        """
+        Statistics of the fitted parameters (ParStat), e.g. `parstat.raOff.mean`, or `parstat.table` as a numpy structured array.
+        """
+        return self._convert("parstat", self._convert_parstat)
 
 
     @property
     def mc(self):
-        r_obj     = r['mc']
-        colnames  = r.colnames(r_obj)
-        obj       = array(r_obj).T
-        print(colnames)
+        """
+        Markov chains of the parameters, each one is a numpy array sharing memory with the R matrix.
+        """
+        names, samples = self._chains
+        return Struct(dict(zip(names, samples)))
+
+
+    @property
+    def parameters(self):
+        """
+        Names of the fitted parameters, in the order of the columns of `chain()`.
+        """
+        return list(self._chains[0])
+
+
+    def chain(self, burn=0, thin=1, params=None):
+        """
+        Markov chains as a 2D numpy array (sample, parameter).
+
+        The result is a strided view of the chains rather than a copy, unless `params` picks parameters that are not evenly spaced.
+        Views share memory with R, keep the FitOutput around while using them.
+
+        `burn`, int: number of samples to drop from the start
 
-        return Struct(dict(zip(colnames, obj)))
+        `thin`, int: keep every `thin`-th sample
+
+        `params`, list: names of the parameters, all of them by default
+        """
+        names, samples = self._chains
+        if burn < 0 or thin < 1:
+            raise ValueError("`burn` should be non-negative and `thin` positive.")
+
+        rows = slice(None)
+        if params is not None:
+            missing = [name for name in params if name not in names]
+            if len(missing) > 0:
+                raise KeyError("Unknown parameters: {}".format(", ".join(missing)))
+
+            rows = [names.index(name) for name in params]
+            steps = set(b - a for a, b in zip(rows[:-1], rows[1:]))
+            if len(steps) <= 1 and steps != {0}:
+                step = steps.pop() if steps else 1
+                stop = rows[-1] + step
+                rows = slice(rows[0], stop if stop >= 0 else None, step)
+
+        return samples[rows, burn::thin].T
+
+
+    def summary(self, burn=0, thin=1, params=None):
+        """
+        Posterior summaries of the chains, computed for all the parameters at once.
+
+        Returns a Struct with `parameters` (names) and arrays of `mean`, `sd`, `median` and the percentiles `x1per`, `x10per`, `x90per`, `x99per` in the same order.
+        Arguments are the same as for `chain()`.
+        """
+        samples = self.chain(burn=burn, thin=thin, params=params)
+        percentiles = percentile(samples, [1, 10, 50, 90, 99], axis=0)
+
+        return Struct(dict(
+            parameters=self.parameters if params is None else list(params),
+            mean=samples.mean(axis=0),
+            sd=samples.std(axis=0, ddof=1),
+            median=percentiles[2],
+            x1per=percentiles[0],
+            x10per=percentiles[1],
+            x90per=percentiles[3],
+            x99per=percentiles[4],
+        ))
 
 
     @property
     def data(self):
-        def _fix_nones_list(column_list):
-            return [None if isinstance(x, NARealType) else x for x in column_list]
+        return self._convert("data", lambda: Struct(dict(zip(*self._raw("Data")))))
+
+
+    @property
+    def model(self):
+        return self._convert("model", lambda: Struct(dict(zip(*self._raw("model")))))
+
 
-        r_obj     = r['Data']
-        colnames  = r.colnames(r_obj)
-        print(colnames)
-        table = [_fix_nones_list(x) for x in r_obj]
+    def _convert(self, name, converter):
+        if name not in self._converted:
+            self._converted[name] = converter()
+        return self._converted[name]
 
-        return Struct(dict(zip(colnames, table)))
+
+    def _raw(self, name):
+        """
+        Column names and values of the object `name` in the fit: a 2D array with the columns as rows for matrices, a list of column arrays for data frames.
+        """
+        key = "raw:" + name # apart from the converted objects, e.g. `model`
+        if self.contents is None:
+            return self._convert(key, lambda: self._read_export(name))
+        return self._convert(key, lambda: self._read_r(name))
+
+
+    def _read_r(self, name):
+        r_obj    = self.contents[name]
+        colnames = list(_r().colnames(r_obj))
+
+        if name in FitOutput._data_frames:
+            return colnames, [_r_vector_to_array(column) for column in r_obj]
+        return colnames, _r_matrix_columns(r_obj)
+
+
+    def _read_export(self, name):
+        if name + "/names" not in array_names(self.path):
+            raise KeyError("'{}' is not in the exported fit {}".format(name, self.path))
+
+        colnames = [str(x) for x in load_array(self.path, name + "/names", mmap=False)]
+        if name in FitOutput._data_frames:
+            return colnames, [load_array(self.path, "{}/{}".format(name, i), mmap=self._mmap) for i in range(len(colnames))]
+        return colnames, load_array(self.path, name + "/values", mmap=self._mmap)
+
+
+    def _convert_parstat(self):
+        colnames, obj = self._raw("ParStat")
+        return ParStat(colnames, obj)
 
 
     @property
-    def model(self):
-        def _fix_nones_list(column_list):
-            return [None if isinstance(x, NARealType) else x for x in column_list]
+    def _chains(self):
+        return self._raw("mc")
+
+
+
+def _r():
+    """
+    The embedded R interpreter, rpy2 is imported and R is started on the first call, so that `import pexopy` doesn't need R.
+    """
+    from rpy2.robjects import r
+    return r
+
+
+def _r_matrix_columns(matrix):
+    """
+    Columns of a numeric R matrix as rows of a 2D numpy array.
+
+    The array is a view of the R memory if rpy2 exposes it as a buffer (R matrices are stored column by column), otherwise a copy.
+    """
+    nrow, ncol = [int(x) for x in _r().dim(matrix)]
+    try:
+        values = frombuffer(matrix.memoryview(), dtype=float64)
+    except (AttributeError, TypeError, ValueError, BufferError):
+        values = asarray(matrix, dtype=float64).ravel(order="F")
+
+    return values.reshape(ncol, nrow)
+
+
+def _r_vector_to_array(vector):
+    """
+    Converts an R vector to a numpy array, NA values become NaN in numeric columns.
+    """
+    from rpy2.robjects.vectors import FactorVector
+    if isinstance(vector, FactorVector):
+        codes = asarray(vector)
+        labels = asarray(list(vector.levels) + ["NA"], dtype=object)
+        return labels[where(codes == _na_integer, len(labels) - 1, codes - 1)]
 
-        r_obj     = r['model']
-        colnames  = r.colnames(r_obj)
-        print(colnames)
-        table = [_fix_nones_list(x) for x in r_obj]
+    values = asarray(vector)
+    if values.dtype.kind in "ib": # integer and logical vectors use the smallest integer for NA
+        missing = values == _na_integer
+        if missing.any():
+            values = values.astype(float)
+            values[missing] = nan
 
-        return Struct(dict(zip(colnames, table)))
+    return values
@@ -1,5 +1,7 @@
 from .uniquefilename import UniqueFile
-from .settings import temp_storage
+from collections import OrderedDict
+from stat import S_ISREG
+import threading
 import numbers
 import os
 
@@ -15,9 +17,18 @@ class ParFile(object):
    You can also just add parameters as function arguments.
 
    Either way, the class instance has both the path (<ParFile.path>) and the dictionary (<ParFile.contents>).
+
+   Files are named by the hash of their contents, so every distinct set of parameters is written once.
+   Parsed files are cached by their path and modification time, and the validated .par text of a dictionary is cached by its items,
+   so building the same ParFile again (e.g. in a sweep) neither reads nor validates anything.
    """
+   _cache_size = 4096 # entries of each of the caches
+   _texts = OrderedDict() # (name, type, value) tuples -> validated .par text
+   _parsed = OrderedDict() # (path, mtime, size) -> parsed contents
+   _cache_lock = threading.Lock()
+   _validators = None # name -> validating function, compiled from `_par` on first use
+
    def __init__(self, par={}, **args):
-      self._storage = temp_storage
       self.temporary = False
       
       if isinstance(par, type(self)):
@@ -27,7 +38,7 @@ class ParFile(object):
          self.contents = self._parse_par(par)
          self.path = par
       elif isinstance(par, dict): # this is a dictionary with the parameters
-         par.update(args)
+         par = dict(par, **args) # never modify the caller's dictionary (or the default one)
          self.contents = par
          self.path = self._generate_par(par)
       else:
@@ -35,65 +46,131 @@ class ParFile(object):
 
 
    def _validate_parameter(self, name, value, error=""):
-      if name not in self._par: # unknown parameter
+      validators = ParFile._validators or ParFile._compile_validators()
+      if name not in validators: # unknown parameter
          errormessage = "{}Unknown parameter '{}'.".format(error, name)
          raise KeyError(errormessage)
 
-      options = self._par[name]["options"]
-      param_type = self._par[name]["type"]
+      validators[name](value, error)
 
-      # cover the type-str conversion
-      if param_type == bool and isinstance(value, str) and value.lower() == "true":
-         value = True
-      if param_type == bool and isinstance(value, str) and value.lower() == "false":
-         value = False
-      if param_type == numbers.Number: # try parsing the string into float 
-         value = float(value)
 
-      if options is not None and value not in options: # there are some set options for this parameter
-         errormessage = "{}The value of '{}' should be one of {}".format(error, name, options)
-         raise ValueError(errormessage)
-      
-      if not isinstance(value, param_type):
-         errormessage = "{}The value of '{}' should be of type {}".format(error, name, param_type)
-         raise ValueError(errormessage)
+   @classmethod
+   def _compile_validators(cls):
+      """
+      Builds a validating function for every parameter in `_par`, with its type and options resolved once.
+      """
+      def compile(name, options, param_type):
+         is_bool = param_type == bool
+         is_number = param_type == numbers.Number
+         allowed = None if options is None else frozenset(options)
+
+         def validate(value, error=""):
+            # cover the type-str conversion
+            if is_bool and isinstance(value, str) and value.lower() in ("true", "false"):
+               value = value.lower() == "true"
+            if is_number: # try parsing the string into float 
+               value = float(value)
+
+            try:
+               is_option = allowed is None or value in allowed
+            except TypeError: # unhashable, e.g. a list, can't be one of the options
+               is_option = False
+            if not is_option: # there are some set options for this parameter
+               errormessage = "{}The value of '{}' should be one of {}".format(error, name, options)
+               raise ValueError(errormessage)
+
+            if not isinstance(value, param_type):
+               errormessage = "{}The value of '{}' should be of type {}".format(error, name, param_type)
+               raise ValueError(errormessage)
+
+         return validate
+
+      cls._validators = {name: compile(name, spec["options"], spec["type"]) for name, spec in cls._par.items()}
+      return cls._validators
+
+
+   @classmethod
+   def _cached(cls, cache, key, compute):
+      """
+      Value of `key` in one of the bounded caches, computed and stored if it's not there.
+      """
+      with cls._cache_lock:
+         if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+
+      value = compute()
+      with cls._cache_lock:
+         cache[key] = value
+         while len(cache) > cls._cache_size:
+            cache.popitem(last=False)
+      return value
 
 
    def _generate_par(self, par_dict):
       self.temporary = True
-      contents = ""
-      for key in par_dict:
-         value = par_dict[key]
-         self._validate_parameter(key, value)
+      return UniqueFile(self._par_text(par_dict), append=".par")
+
+
+   def _par_text(self, par_dict):
+      """
+      Validates the parameters and returns them in the .par file format.
+      """
+      try:
+         key = tuple((name, type(value), value) for name, value in par_dict.items())
+         hash(key)
+      except TypeError: # unhashable values (e.g. lists) can't be a cache key, validate and format them without the cache
+         key = None
+
+      if key is None:
+         return self._format_par(par_dict)
+      return ParFile._cached(ParFile._texts, key, lambda: self._format_par(par_dict))
+
+
+   def _format_par(self, par_dict):
+      validators = ParFile._validators or ParFile._compile_validators()
+      lines = []
+      for key, value in par_dict.items():
+         if key not in validators:
+            self._validate_parameter(key, value) # raises the error
+         validators[key](value)
 
          # handle the bool-to-str
          value = str(value).upper() if isinstance(value, bool) else value
-         contents += "{} {}\n".format(key, value)
-
-      filename = UniqueFile(contents, append=".par")
-      par_path = os.path.join(self._storage, filename)
-      
-      with open(par_path, "w") as f:
-         f.write(contents)
+         lines.append("{} {}\n".format(key, value))
 
-      return par_path
+      return "".join(lines)
 
 
    def _parse_par(self, par_path):
-      if not os.path.isfile(par_path):
+      try:
+         stat = os.stat(par_path)
+      except OSError:
+         stat = None
+      if stat is None or not S_ISREG(stat.st_mode):
          errormessage = "File '{}' does not exist.".format(par_path)
          raise IOError(errormessage)
 
+      key = (os.path.abspath(par_path), stat.st_mtime_ns, stat.st_size)
+      return dict(ParFile._cached(ParFile._parsed, key, lambda: self._read_par(par_path))) # a copy, the cached one is shared
+
+
+   def _read_par(self, par_path):
+      validators = ParFile._validators or ParFile._compile_validators()
+      error = "Error while parsing the .par file: {}. ".format(par_path)
+
       # read the .par file into a dictionary
       par = {}
       with open(par_path) as f:
          for line in f:
                s = line.split()
                if len(s) != 2:
-                  errormessage = "Error while parsing the .par file: {par_path}. Must only have two columns, i.e. 'name value', {} columns encountered.".format(par_path, len(s))
-                  raise ValueError()
+                  errormessage = "{}Must only have two columns, i.e. 'name value', {} columns encountered.".format(error, len(s))
+                  raise ValueError(errormessage)
 
-               self._validate_parameter(s[0], s[1], error="Error while parsing the .par file: {}. ".format(par_path))
+               if s[0] not in validators:
+                  self._validate_parameter(s[0], s[1], error=error) # raises the error
+               validators[s[0]](s[1], error)
                
                # didn't raise an error, all must be good with this parameter
                par[s[0]] = s[1]
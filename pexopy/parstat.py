@@ -0,0 +1,96 @@
+import numpy as np
+
+from .struct import ArrayStruct
+
+
+class ParStat(object):
+    """
+    Statistics of the fitted parameters (the ParStat matrix of a PEXO fit), see `FitOutput.parstat`.
+
+    `parstat.raOff.mean` is a statistic of a single parameter, `parstat.table["mean"]` the same statistic of all the parameters,
+    in the order of `parameters`, and `parstat.values` all of them as a 2D array (parameter, statistic).
+
+    `parameters`, list: names of the parameters
+
+    `values`, 2D array: statistics of every parameter (parameter, statistic), in the order of `ParStat.statistics`
+    """
+    __slots__ = ("parameters", "table", "_rows")
+    statistics = ["xopt", "x1per", "x99per", "x10per", "x90per", "xminus", "xplus", "mode", "mean", "sd", "skewness", "kurtosis"]
+
+    def __init__(self, parameters, values):
+        values = np.ascontiguousarray(values, dtype=np.float64)
+        values = values.reshape(len(parameters), -1) if len(parameters) > 0 else np.empty((0, len(ParStat.statistics)))
+        names = ParStat.statistics[:values.shape[1]] + ["stat{}".format(i) for i in range(len(ParStat.statistics), values.shape[1])]
+
+        self.parameters = list(parameters)
+        self.table = values.view([(name, np.float64) for name in names]).reshape(len(self.parameters)) # shares memory with `values`
+        self._rows = {name: i for i, name in enumerate(self.parameters)}
+
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError as e:
+            raise AttributeError(str(e))
+
+
+    def __getitem__(self, name):
+        """
+        Statistics of the parameter `name`, an `ArrayStruct` with a property for every statistic.
+        """
+        if name not in self._rows:
+            raise KeyError("Unknown parameter '{}'.".format(name))
+        return ArrayStruct(self.table[self._rows[name]])
+
+
+    def __len__(self):
+        return len(self.parameters)
+
+
+    def __dir__(self):
+        return list(self.parameters) + ["parameters", "table", "values", "dictionary"]
+
+
+    @property
+    def values(self):
+        """
+        Statistics as a 2D float array (parameter, statistic), a view of `table`.
+        """
+        return self.table.view(np.float64).reshape(len(self.parameters), len(self.table.dtype.names))
+
+
+    @property
+    def dictionary(self):
+        return {name: self[name].dictionary for name in self.parameters}
+
+
+
+def stack_parstat(fits, parameters=None, statistics=None):
+    """
+    ParStat of many fits as a single 3D array (fit, parameter, statistic) for vectorised comparisons,
+    e.g. `stack_parstat(fits, ["raOff"], ["mean", "sd"])`. Missing parameters of a fit are NaN.
+
+    `fits`, list: FitOutput or ParStat objects
+
+    `parameters`, list: names of the parameters, all the parameters of the fits by default (in the order they first appear)
+
+    `statistics`, list: names of the statistics, `ParStat.statistics` by default
+    """
+    parstats = [fit if isinstance(fit, ParStat) else fit.parstat for fit in fits]
+    if parameters is None:
+        parameters = list(dict.fromkeys(name for parstat in parstats for name in parstat.parameters))
+    statistics = ParStat.statistics if statistics is None else list(statistics)
+
+    stacked = np.full((len(parstats), len(parameters), len(statistics)), np.nan)
+    for i, parstat in enumerate(parstats):
+        rows = [(j, parstat._rows[name]) for j, name in enumerate(parameters) if name in parstat._rows]
+        if len(rows) == 0:
+            continue
+        target, source = [list(x) for x in zip(*rows)]
+        for k, statistic in enumerate(statistics):
+            if statistic in parstat.table.dtype.names:
+                stacked[i, target, k] = parstat.table[statistic][source]
+
+    return stacked
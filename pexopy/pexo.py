@@ -1,19 +1,69 @@
 import os
 import re
-from subprocess import Popen, PIPE, call, check_output
+import time
+import shlex
+from functools import partial
+from shutil import which
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+import numpy as np
 from .output import EmulationOutput, FitOutput
-from .arguments import PexoArguments
+from .multichain import MultiChainFit
+from .arguments import PexoArguments, time_epochs
+from .incremental import epoch_rows, match_epochs, merge_epochs
+from .table import write_table
+from .tempstore import remove_output
+from .workers import WorkerPool
+from .asyncprocess import AsyncPexoProcess
+from .cache import ResultCache, pexo_revision
+from .metrics import RunStats, metrics
+from .limits import ResourceLimits, PexoProcessError, run_process
+from .budget import CoreBudget
 
 
 class Pexo(object):
     """
     A Python wrapper for PEXO - https://github.com/phillippro/pexo/
+
+    `workers`, int: number of warm R processes to run PEXO in, 0 starts a new Rscript for every run
+
+    `recycle`, int: number of runs after which a warm R process is restarted
+
+    `cache`, bool or ResultCache: default for the `cache` argument of `Pexo.run`
+
+    `backend`, str: "subprocess" runs PEXO with Rscript, "embedded" runs it in the R session embedded in Python by rpy2,
+    without starting R for every run or writing the output to a file (Rscript is not needed then, and the runs are executed one at a time)
+
+    `limits`, ResourceLimits: default time, memory and CPU limits of the PEXO processes, see `Pexo.run`
+
+    `budget`, CoreBudget or bool: machine-wide budget of CPU cores, runs wait until the cores for their `ncore` are free (True uses a `CoreBudget` with default settings)
     """
-    def __init__(self, Rscript=None, pexodir=None, verbose=True):
+    backends = ["subprocess", "embedded"]
+
+    def __init__(self, Rscript=None, pexodir=None, verbose=True, workers=0, recycle=50, cache=False, backend="subprocess", limits=None, budget=None):
+        if backend not in Pexo.backends:
+            raise ValueError("Unknown backend '{}', should be one of: {}".format(backend, ", ".join(Pexo.backends)))
+        if backend == "embedded" and workers > 0:
+            raise ValueError("Warm R workers can't be used with the embedded backend.")
+        if backend == "embedded" and limits is not None:
+            raise ValueError("Resource limits can't be applied to the embedded backend, PEXO runs in this process.")
+
         self.verbose = verbose
+        self.pool = None
+        self.session = None
+        self.cache = cache
+        self._default_cache = None # ResultCache with default settings for `cache=True`, created on first use
+        self.backend = backend
+        self.limits = limits
+        self.budget = CoreBudget() if budget is True else (budget or None)
         self.setup(Rscript, pexodir, verbose)
 
+        if workers > 0:
+            self.pool = WorkerPool(self.Rscript, self.pexodir_code, size=workers, recycle=recycle, verbose=verbose)
+        if backend == "embedded":
+            from .embedded import EmbeddedSession
+            self.session = EmbeddedSession(self.pexodir_code, verbose=verbose)
+
 
     def setup(self, Rscript=None, pexodir=None, verbose=False):
         """
@@ -28,13 +78,12 @@ class Pexo(object):
 
         # Find and validate Rscript
 
-        if Rscript is None: # find Rscript
-            with open(os.devnull, 'w') as FNULL:
-                rc = call(['which', 'Rscript'], stdout=FNULL)
+        if Rscript is None and self.backend == "embedded": # R is embedded, Rscript is optional
+            self.Rscript = None
 
-            if rc == 0: # 'which' found the path
-                self.Rscript = check_output("which Rscript", shell=True).decode("ascii").strip()
-            else: # 'which' returned an error
+        elif Rscript is None: # find Rscript
+            self.Rscript = _find_Rscript()
+            if self.Rscript is None:
                 raise OSError("Could not find Rscript. Make sure it's installed correctly or specify the path to it in Pexo.setup(Rscript=)")
 
         else: # use the path provided by user
@@ -43,7 +92,8 @@ class Pexo(object):
             else:
                 raise OSError("Specified Rscript path is not valid.")
 
-        self._print("Found Rscript at {}".format(self.Rscript))
+        if self.Rscript is not None:
+            self._print("Found Rscript at {}".format(self.Rscript))
 
         # Find and validate PEXO directory path
 
@@ -56,53 +106,497 @@ class Pexo(object):
             self.pexodir = pexodir
 
         # make sure this folder is legit
-        if not os.path.exists(self.pexodir) or \
-            not os.path.exists(os.path.join(self.pexodir, "code")) or \
-            not os.path.isfile(os.path.join(self.pexodir, "code/pexo.R")):
+        if not _is_pexodir(self.pexodir):
             raise OSError("The PEXO directory specified is not valid.")
-            
+
         self._print("Found PEXO at    {}".format(self.pexodir))
 
         self.pexo_main    = os.path.join(self.pexodir, "code/pexo.R")
         self.pexodir_code = os.path.join(self.pexodir, "code")
 
 
-    def run(self, **args):
+    def run(self, cache=None, split=None, seed=None, limits=None, priority=0, incremental=False, **args):
         """
         Run PEXO.
 
         Specify PEXO arguments in this function (same naming convention, see documentation).
+
+        `cache`, bool or ResultCache: reuse the output of an identical earlier run if there is one, and store the output otherwise. True uses a `ResultCache` with default settings, None falls back to the `cache` given to `Pexo`.
+
+        `split`, int: split the --time epochs of an emulation into this many chunks, emulate them in parallel PEXO processes and merge the outputs
+
+        `seed`, int: seed of the R random number generator for the run, e.g. for reproducible fits (runs with a seed don't use the warm workers)
+
+        `limits`, ResourceLimits: wall-clock timeout, memory and CPU limits and niceness of the PEXO process, None falls back to the `limits` given to `Pexo`.
+        Runs with limits don't use the warm workers. A run that fails or exceeds the time limit raises `PexoProcessError` with the last lines of PEXO output.
+
+        `priority`, int: with a core `budget`, runs with a higher priority are admitted first
+
+        `incremental`, bool: for emulations, reuse the epochs of the earlier cached emulations of the same target with the same settings
+        (all the arguments but --time) and only emulate the epochs that are new, e.g. when observation times are appended to a grid.
+        This needs a cache (a default `ResultCache` is used if `cache` is not set, the `cache` of `Pexo` is not changed).
         """
-        # validate & normalise arguments
-        arguments = PexoArguments(args)
-        command = "{} pexo.R {}".format(self.Rscript, str(arguments))
-        self._print("Running PEXO with:\n$ " + "".join(command) + "\n")
+        return self._run(args, cache=cache, split=split, seed=seed, limits=limits, priority=priority, incremental=incremental)
+
+
+    def _run(self, args, cache=None, split=None, seed=None, limits=None, priority=0, incremental=False, nested=False):
+        """
+        Body of `run`, `nested` runs (parts of another run, e.g. chunks of a split) are not recorded in the metrics.
+        """
+        limits = self.limits if limits is None else limits
+        if limits is not None and self.session is not None:
+            raise ValueError("Resource limits can't be applied to the embedded backend, PEXO runs in this process.")
+        cache = self._result_cache(self.cache if cache is None else cache)
+        if incremental and cache is None:
+            cache = self._result_cache(True)
+        stats = RunStats(record=not nested)
+        arguments = None
+        error = None
+
+        try:
+            # validate & normalise arguments
+            start = time.perf_counter()
+            arguments = PexoArguments(args)
+            stats.mode = arguments.mode
+            stats.add("arguments", time.perf_counter() - start - arguments.file_time)
+            stats.add("files", arguments.file_time)
+            stats.bytes_written += sum(os.path.getsize(path) for path in arguments.temp_files if os.path.isfile(path))
+
+            if cache is None:
+                return self._compute(arguments, args, split, stats, seed, limits, priority)
+
+            with stats.phase("cache"):
+                key = cache.fingerprint(arguments, self.revision, seed=seed)
+                append = os.path.splitext(arguments.out)[1]
+                hit = cache.get(key, arguments.out, append=append)
+
+            if hit:
+                self._print("Found the output in the cache.")
+                metrics.inc("pexopy_cache_hits_total")
+                stats.cached = True
+                return self._load_output(arguments, stats)
+
+            metrics.inc("pexopy_cache_misses_total")
+            if incremental and arguments.mode == "emulate" and arguments.time is not None:
+                output, stored = self._run_incremental(arguments, args, cache, split, stats, seed, limits, priority)
+            else:
+                output, stored = self._compute(arguments, args, split, stats, seed, limits, priority), False
+            if stored: # the rows are in the table of the cached epochs, no need for another copy
+                return output
+
+            if output.path is None: # kept in memory by the embedded backend, the cache needs a file
+                output.saveto(arguments.out)
+            if isinstance(output, EmulationOutput):
+                output.contents # writes the binary copy of the table, it's cached too
+            with stats.phase("cache"):
+                cache.put(key, arguments.out, append=append)
+            return output
+
+        except Exception as e:
+            error = e
+            raise
+
+        finally:
+            # clean up temp files if any
+            if arguments is not None:
+                arguments.clear_temp()
+            if not nested:
+                metrics.record_run(stats, error)
+
+
+    def _compute(self, arguments, args, split=None, stats=None, seed=None, limits=None, priority=0):
+        stats = RunStats(arguments.mode) if stats is None else stats
+        if split is not None and split > 1 and arguments.mode == "emulate":
+            return self._run_split(arguments, args, split, stats, limits, priority)
+
+        if self.budget is None:
+            output = self._execute(arguments, stats, seed, limits)
+        else:
+            with stats.phase("queue"):
+                reservation = self.budget.acquire(arguments.ncore or 1, priority=priority)
+            with reservation:
+                if reservation.cpus is not None and self.session is None:
+                    limits = (limits or ResourceLimits()).pinned(reservation.cpus)
+                output = self._execute(arguments, stats, seed, limits)
+        if output is not None:
+            return output
+        return self._load_output(arguments, stats)
+
+
+    def _run_split(self, arguments, args, split, stats, limits=None, priority=0):
+        """
+        Emulates chunks of the --time epochs in parallel and merges them into the output of the whole run.
+        The chunks are merged in their order, so the rows are in the order of the --time epochs, same as without splitting.
+        """
+        chunks = [chunk for chunk in np.array_split(time_epochs(arguments.time), split) if len(chunk) > 0]
+        chunk_args = {key: value for key, value in args.items() if key not in ("t", "time", "o", "out")}
+        self._print("Splitting {} epochs into {} chunks.".format(sum(len(chunk) for chunk in chunks), len(chunks)))
+
+        def emulate(chunk):
+            return self._run(dict(chunk_args, time=chunk), cache=False, limits=limits, priority=priority, nested=True)
+
+        with stats.phase("pexo"), ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(emulate, chunk) for chunk in chunks]
+
+        try:
+            outputs = [future.result() for future in futures]
+            with stats.phase("merge"):
+                merged = np.concatenate([output.contents for output in outputs])
+                if self.session is None:
+                    write_table(arguments.out, merged)
+        finally: # outputs of all the chunks that succeeded, also when another one has failed
+            for future in futures:
+                if future.exception() is None and future.result().path is not None:
+                    remove_output(future.result().path)
+
+        peak_rss = [output.stats.peak_rss for output in outputs if output.stats.peak_rss is not None]
+        stats.peak_rss = max(peak_rss) if len(peak_rss) > 0 else None
+        if self.session is not None:
+            return EmulationOutput.from_array(merged, stats=stats)
+
+        stats.bytes_written += os.path.getsize(arguments.out)
+        return self._load_output(arguments, stats)
+
+
+    def _run_incremental(self, arguments, args, cache, split, stats, seed=None, limits=None, priority=0):
+        """
+        Emulates only the --time epochs that are not among the cached epochs of the same emulation, and merges them with the cached ones.
+        The rows of the output are in the order of the --time epochs.
+
+        Returns a tuple (output, True if its rows are stored in the table of the cached epochs).
+        Only PEXO runs for the new epochs, the table of the cached epochs is read whole and written again when it's extended.
+        """
+        with stats.phase("cache"):
+            key = cache.fingerprint(arguments, self.revision, seed=seed, epochs=False)
+            epochs = epoch_rows(time_epochs(arguments.time))
+            known = cache.get_epochs(key)
+        if known is not None and known[0].shape[1] != epochs.shape[1]: # split JDs vs whole JDs, keep the cached ones
+            return self._compute(arguments, args, split, stats, seed, limits, priority), False
+
+        if known is None:
+            output = self._compute(arguments, args, split, stats, seed, limits, priority)
+            table = output.contents
+            if len(table) != len(epochs): # one row per epoch, otherwise the rows can't be matched to the epochs
+                return output, False
+            with stats.phase("cache"):
+                cache.put_epochs(key, *merge_epochs(epochs, table))
+            return output, True
+
+        known_epochs, table = known
+        index, found = match_epochs(known_epochs, epochs)
+        if not found.all():
+            missing = np.unique(epochs[~found], axis=0)
+            self._print("Emulating {} new epochs, {} are cached.".format(len(missing), int(found.sum())))
+
+            new_args = {name: value for name, value in args.items() if name not in ("t", "time", "o", "out")}
+            with stats.phase("pexo"):
+                new_args["time"] = missing[:, 0] if missing.shape[1] == 1 else missing
+                new_output = self._run(new_args, cache=False, split=split, seed=seed, limits=limits, priority=priority, nested=True)
+            new_table = np.array(new_output.contents) # copy, the files are removed
+            if new_output.path is not None:
+                remove_output(new_output.path)
+
+            if len(new_table) != len(missing) or new_table.dtype != table.dtype: # can't be merged, emulate everything
+                return self._compute(arguments, args, split, stats, seed, limits, priority), False
+
+            with stats.phase("merge"):
+                known_epochs, table = merge_epochs(known_epochs, table, missing, new_table)
+            with stats.phase("cache"):
+                cache.put_epochs(key, known_epochs, table)
+            index, found = match_epochs(known_epochs, epochs)
+        else:
+            self._print("Found all the {} epochs in the cache.".format(len(epochs)))
+            stats.cached = True
+
+        with stats.phase("merge"):
+            table = table[index]
+            if self.session is not None:
+                return EmulationOutput.from_array(table, stats=stats), True
+            write_table(arguments.out, table)
+
+        stats.bytes_written += os.path.getsize(arguments.out)
+        return self._load_output(arguments, stats), True
+
+
+    def run_many(self, jobs, max_workers=None):
+        """
+        Run PEXO for each dictionary of arguments in `jobs` in parallel.
+
+        Yields a `JobResult` for every job as soon as it finishes, a failed job does not stop the others.
+
+        `jobs`, list: dictionaries with PEXO arguments, same as for `Pexo.run`
+
+        `max_workers`, int: number of PEXO processes to run at the same time (number of CPUs by default)
+
+        If the caller stops iterating early, the jobs that haven't started yet are dropped, the running ones are waited for,
+        and their default outputs (jobs without `out`) are removed.
+        """
+        jobs = list(jobs)
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.run, **job): index for index, job in enumerate(jobs)}
+            yielded = set()
+            try:
+                for future in as_completed(futures):
+                    index = futures[future]
+                    error = future.exception()
+                    output = None if error is not None else future.result()
+                    yielded.add(index)
+                    yield JobResult(index, jobs[index], output, error)
+            finally:
+                # the caller stopped iterating, drop the jobs that haven't started yet
+                for future in futures:
+                    future.cancel()
+                executor.shutdown(wait=True)
+                for future, index in futures.items():
+                    if index in yielded or future.cancelled() or future.exception() is not None:
+                        continue
+                    output = future.result()
+                    if output.path is not None and "o" not in jobs[index] and "out" not in jobs[index]:
+                        remove_output(output.path)
+
+
+    def fit_multichain(self, n_chains=4, seeds=None, max_workers=None, rhat=None, ess=None, burn=0, **args):
+        """
+        Run `n_chains` independent fits with different random seeds in parallel PEXO processes and merge them into a `MultiChainFit`.
+
+        `args` are the PEXO arguments of the fit (primary, Niter, ...), same for all the chains.
+
+        `seeds`, list: random seeds of the chains, random by default
+
+        `max_workers`, int: number of chains to run at the same time, see `Pexo.run_many`
+
+        `rhat`, float: stop early once the finished chains have converged, i.e. their split R-hat is below `rhat` for all the parameters
+        (and the effective sample size is above `ess`, if set). Chains that have not started yet are not run then, so this is only useful
+        with more chains than `max_workers`. Chains that are running at that point are waited for and their outputs are removed.
+
+        `burn`, int: number of samples dropped from the start of every chain for the convergence check
+        """
+        if seeds is None:
+            seeds = np.random.default_rng().integers(1, 2**31 - 1, n_chains).tolist()
+        if len(seeds) != n_chains:
+            raise ValueError("Number of seeds should be the same as the number of chains.")
+        for key in ("m", "mode", "o", "out"):
+            if key in args:
+                raise ValueError("'{}' is set by fit_multichain and can't be passed to it".format(key))
+
+        jobs = [dict(args, mode="fit", seed=seed) for seed in seeds]
+        finished = {}
+        results = self.run_many(jobs, max_workers=max_workers)
+        try:
+            for result in results:
+                if not result.ok:
+                    raise result.error
+                finished[result.index] = result.output
+
+                if rhat is not None and len(finished) >= 2 and len(finished) < n_chains:
+                    fit = MultiChainFit([finished[i] for i in sorted(finished)])
+                    if fit.converged(rhat=rhat, ess=ess, burn=burn):
+                        self._print("Chains have converged after {} of {} fits.".format(len(finished), n_chains))
+                        break
+        finally:
+            results.close() # cancels the chains that haven't started
+
+        indices = sorted(finished)
+        return MultiChainFit([finished[i] for i in indices], seeds=[seeds[i] for i in indices])
+
+
+    async def start_async(self, limits=None, **args):
+        """
+        Start PEXO in a child process from an asyncio event loop and return an `AsyncPexoProcess` without waiting for it to finish.
+
+        Use `async for stream, line in process.lines()` to follow PEXO output and `await process.wait()` to get the output.
+        Warm R workers are not used here, every run is a separate Rscript process, so this needs the "subprocess" backend.
+
+        `limits`, ResourceLimits: same as for `Pexo.run`, the time limit is counted from the start until `wait()` returns
+        """
+        if self.Rscript is None:
+            raise OSError("Rscript is needed to start PEXO in a child process, specify the path to it in Pexo.setup(Rscript=)")
+
+        stats = RunStats()
+        arguments = None
+        try:
+            start = time.perf_counter()
+            arguments = PexoArguments(args)
+            stats.mode = arguments.mode
+            stats.add("arguments", time.perf_counter() - start - arguments.file_time)
+            stats.add("files", arguments.file_time)
+
+            command = [self.Rscript, "pexo.R"] + arguments.argv
+            self._print("Starting PEXO with:\n$ " + " ".join(shlex.quote(x) for x in command) + "\n")
+
+            limits = self.limits if limits is None else limits
+            return await AsyncPexoProcess.start(command, self.pexodir_code, arguments, self._load_output, stats, limits=limits)
+        except BaseException as e: # the process records the run once it has started
+            if arguments is not None:
+                arguments.clear_temp()
+            metrics.record_run(stats, e)
+            raise
+
+
+    async def run_async(self, **args):
+        """
+        Run PEXO from an asyncio event loop, same as `Pexo.run` but without blocking the loop.
+
+        Cancelling the task kills the PEXO process. With the embedded backend, the run is executed in a thread and can't be cancelled.
+        """
+        import asyncio
+        if self.session is not None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, partial(self.run, **args))
+
+        process = await self.start_async(**args)
+        try:
+            async for stream, line in process.lines():
+                if self.verbose:
+                    print(line)
+        except BaseException:
+            process.kill()
+            try: # lets the readers finish, removes the temp files and records the run
+                await process.wait()
+            except (asyncio.CancelledError, Exception):
+                pass
+            raise
+        return await process.wait()
+
+
+    def _execute(self, arguments, stats, seed=None, limits=None):
+        """
+        Runs PEXO, returns the output if the backend keeps it in memory, otherwise None.
+        """
+        command = [self.Rscript or "Rscript", "pexo.R"] + arguments.argv
+        if seed is not None: # PEXO has no seed argument, set it in a bootstrap script that runs pexo.R
+            command = [self.Rscript or "Rscript", _seeded_script, str(int(seed)), self.pexodir_code] + arguments.argv
+        self._print("Running PEXO with:\n$ " + " ".join(shlex.quote(x) for x in command) + "\n")
+        output = None
+
+        if self.session is not None: # records the "pexo" phase itself, converting the output is the "parse" phase
+            rc, output = self.session.run(arguments.argv, arguments.out, stats=stats, seed=seed)
+
+        elif self.pool is not None and seed is None and limits is None:
+            with stats.phase("pexo"):
+                rc = self.pool.run(arguments.argv)
 
-        # RUN PEXO
-        code_dir = os.path.join(self.pexodir, "code")
-        if self.verbose:
-            rc = call(command, cwd=code_dir, shell=True)
         else:
-            with open(os.devnull, "w") as FNULL:
-                rc = call(command, cwd=code_dir, shell=True, stdout=FNULL, stderr=FNULL)
+            with stats.phase("pexo"):
+                rc, stats.peak_rss, tail, timed_out = run_process(command, self.pexodir_code, limits, verbose=self.verbose)
+            if timed_out:
+                raise PexoProcessError(rc, tail, timeout=limits.timeout)
+            if rc != 0:
+                raise PexoProcessError(rc, tail)
 
         if rc != 0:
             errormessage = "Underlying PEXO code return non-zero exit status {}.".format(rc)
             raise ChildProcessError(errormessage)
 
+        if output is None and os.path.isfile(arguments.out):
+            stats.bytes_written += os.path.getsize(arguments.out)
+
         self._print("Done.")
+        return output
+
+
+    @property
+    def revision(self):
+        """
+        Revision of the PEXO code, see `pexo_revision`.
+        """
+        if getattr(self, "_revision", None) is None:
+            self._revision = pexo_revision(self.pexodir)
+        return self._revision
 
+
+    def _result_cache(self, cache):
+        if cache is True:
+            if isinstance(self.cache, ResultCache):
+                return self.cache
+            if self._default_cache is None:
+                self._default_cache = ResultCache()
+            return self._default_cache
+        if isinstance(cache, ResultCache):
+            return cache
+        return None
+
+
+    def _load_output(self, arguments, stats=None):
         if arguments.mode == "fit":
-            output = FitOutput(arguments.out)
-        else:
-            output = EmulationOutput(arguments.out)
+            return FitOutput(arguments.out, stats=stats)
+        return EmulationOutput(arguments.out, stats=stats)
+
+
+    def close(self):
+        """
+        Stop the warm R workers, if any.
+        """
+        if self.pool is not None:
+            self.pool.close()
 
-        # clean up temp files if any and come back to the original directory
-        arguments.clear_temp()
-        return output
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
 
 
     def _print(self, message):
         timestamp = datetime.now().strftime("%H:%M:%S.%f")[0:10]
         if self.verbose:
             print("[{}] {}".format(timestamp, str(message)))
+
+
+
+class JobResult(object):
+    """
+    Result of a single job in `Pexo.run_many`.
+
+    `index`, int: position of the job in the list of jobs
+
+    `args`, dict: PEXO arguments of the job
+
+    `output`, EmulationOutput or FitOutput: output of the job, None if it has failed
+
+    `error`, Exception: the error raised by the job, None if it has succeeded
+    """
+    def __init__(self, index, args, output, error):
+        self.index  = index
+        self.args   = args
+        self.output = output
+        self.error  = error
+
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+
+_seeded_script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "R", "seeded.R")
+_discovered = {} # Rscript and PEXO directories found so far in this process
+
+
+def _find_Rscript():
+    """
+    Path to Rscript on the PATH or None, looked up once per process.
+    """
+    if "Rscript" not in _discovered:
+        path = which("Rscript")
+        if path is None:
+            return None
+        _discovered["Rscript"] = path
+    return _discovered["Rscript"]
+
+
+def _is_pexodir(path):
+    """
+    Whether `path` is a PEXO repository (with code/pexo.R), checked once per process for every path.
+    """
+    path = os.path.abspath(path)
+    if path not in _discovered:
+        if not os.path.isfile(os.path.join(path, "code", "pexo.R")):
+            return False
+        _discovered[path] = True
+    return True
@@ -1,13 +1,69 @@
 import os
+import warnings
+import tempfile
+
+__all__ = ["module_path", "cache_storage", "core_budget_storage", "get_temp_storage", "get_temp_max_size", "set_temp_storage"]
 
 def _ensurePathExists(folder):
     if not os.path.exists(folder):
-        os.makedirs(folder)
+        os.makedirs(folder, exist_ok=True)
 
 module_path = os.path.dirname(os.path.abspath(__file__))
-temp_storage = os.path.normpath(os.path.join(module_path, "../tmp")) # temporary file storage path
+cache_storage = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "pexopy") # ResultCache default path
+core_budget_storage = os.environ.get("PEXOPY_CORE_BUDGET", os.path.join(tempfile.gettempdir(), "pexopy-cores.json")) # CoreBudget default state file
+
+_temp_storage = os.environ.get("PEXOPY_TEMP_STORAGE") # temporary file storage path, see get_temp_storage
+_temp_max_size = os.environ.get("PEXOPY_TEMP_MAX_SIZE") # bytes, see get_temp_max_size
+_unchanged = object() # default of `set_temp_storage(max_size=...)`, None removes the limit
+
+
+def get_temp_storage():
+    """
+    Path of the temporary file storage (.tim and .par files generated from the arguments, default outputs), created on first use.
+
+    Set it with `set_temp_storage` or the $PEXOPY_TEMP_STORAGE environment variable, e.g. to a folder in /dev/shm; <pexopy>/../tmp by default.
+    The folder is managed by pexopy, don't point it to a folder with other files.
+    """
+    folder = _temp_storage or os.path.normpath(os.path.join(module_path, "../tmp"))
+    _ensurePathExists(folder)
+    return folder
+
+
+def get_temp_max_size():
+    """
+    Size limit of the temporary file storage in bytes, None if unlimited.
+
+    Set it with `set_temp_storage` or the $PEXOPY_TEMP_MAX_SIZE environment variable.
+    """
+    return None if _temp_max_size is None else int(_temp_max_size)
+
+
+def set_temp_storage(path=None, max_size=_unchanged):
+    """
+    Change the temporary file storage `path` (None keeps the current one) and its size limit `max_size` in bytes (None removes the limit,
+    the current limit is kept if it's not passed).
+
+    Files that are in use are never removed, so the storage can be above the limit while many runs are active.
+    """
+    global _temp_storage, _temp_max_size
+    if path is not None:
+        _temp_storage = os.path.abspath(path)
+    if max_size is not _unchanged:
+        _temp_max_size = None if max_size is None else int(max_size)
+
+
+def _deprecated(module, name):
+    """
+    Deprecated names of the settings, looked up by the `__getattr__` of `module`.
+    """
+    if name == "temp_storage": # a constant before the storage could be moved
+        warnings.warn("`temp_storage` is deprecated, use `get_temp_storage()` and `set_temp_storage()`.", DeprecationWarning, stacklevel=3)
+        return get_temp_storage()
+    raise AttributeError("module '{}' has no attribute '{}'".format(module, name))
+
 
-_ensurePathExists(temp_storage)
+def __getattr__(name):
+    return _deprecated(__name__, name)
 
 if __name__ == "__main__":
     raise Exception("This is a settings file, no point in running it.")
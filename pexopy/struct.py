@@ -31,3 +31,43 @@ class Struct(object):
     @property
     def dictionary(self):
         return self.__dict__
+
+
+
+class ArrayStruct(object):
+    """
+    Property container backed by a record of a numpy structured array (e.g. a row of `ParStat.table`), the values are read from
+    and written to the array instead of being copied into a dictionary.
+
+    Usage:
+    In [1]: s = ArrayStruct(parstat.table[0])
+    In [2]: s.mean
+            0.53
+    """
+    __slots__ = ("_record",)
+
+    def __init__(self, record):
+        object.__setattr__(self, "_record", record)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._record[name]
+        except (KeyError, ValueError, IndexError):
+            raise AttributeError("No field '{}', the fields are: {}".format(name, ", ".join(self._record.dtype.names)))
+
+    def __setattr__(self, name, value):
+        if name not in self._record.dtype.names:
+            raise AttributeError("No field '{}', the fields are: {}".format(name, ", ".join(self._record.dtype.names)))
+        self._record[name] = value
+
+    def __dir__(self):
+        return list(self._record.dtype.names)
+
+    def __repr__(self):
+        return "ArrayStruct({})".format(", ".join("{}={}".format(name, self._record[name]) for name in self._record.dtype.names))
+
+    @property
+    def dictionary(self):
+        return {name: self._record[name] for name in self._record.dtype.names}
@@ -0,0 +1,211 @@
+import hashlib
+import numbers
+import itertools
+import numpy as np
+
+from .parfile import ParFile
+from .table import load_table
+from .tempstore import remove_output
+
+
+class Sweep(object):
+    """
+    Emulations of the same target with some of the .par parameters varied, see `Sweep.grid`, `Sweep.random` and `Sweep.lhs`.
+
+    `base`, ParFile, dict or str: parameters shared by all the points (a ParFile, a dictionary, or a path to a .par file)
+
+    `points`, list: dictionaries of the varied parameters, one per emulation
+
+    All the points are validated here, before anything is run, and identical configurations (same .par contents) are only kept once.
+    """
+    def __init__(self, base, points):
+        self.base = base if isinstance(base, ParFile) else ParFile(dict(base) if isinstance(base, dict) else base)
+        self.parameters = []
+        self.points = []
+        self.failed = {} # point index -> error, set by `run`
+
+        seen = set()
+        for point in points:
+            point = {name: _normalise(name, value) for name, value in point.items()}
+            for name in point:
+                if name not in self.parameters:
+                    self.parameters.append(name)
+
+            contents = self.base._par_text(self._merge(point)) # raises KeyError/ValueError for invalid points
+            digest = hashlib.md5(contents.encode("utf-8")).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                self.points.append(point)
+
+        missing = [(i, name) for i, point in enumerate(self.points) for name in self.parameters if name not in point]
+        if len(missing) > 0:
+            raise ValueError("Point {} does not set '{}', all the points should vary the same parameters.".format(*missing[0]))
+
+
+    @classmethod
+    def grid(cls, base, **values):
+        """
+        All the combinations of the parameter `values`, e.g. `Sweep.grid(par, RefType=["none", "refro"], P=numpy.linspace(1, 10, 10))`.
+
+        None instead of a list takes all the options of a parameter, e.g. `BinaryModel=None`.
+        """
+        names = list(values)
+        options = [_options(name, values[name]) for name in names]
+        return cls(base, [dict(zip(names, combination)) for combination in itertools.product(*options)])
+
+
+    @classmethod
+    def random(cls, base, n, seed=None, **ranges):
+        """
+        `n` random points, numeric parameters are drawn uniformly from (low, high) tuples and the others from lists of options (None for all of them).
+
+        `seed`, int: seed of the random number generator
+        """
+        rng = np.random.default_rng(seed)
+        columns = {}
+        for name, spec in ranges.items():
+            if _is_range(spec):
+                columns[name] = rng.uniform(spec[0], spec[1], n).tolist()
+            else:
+                options = _options(name, spec)
+                columns[name] = [options[i] for i in rng.integers(0, len(options), n)]
+
+        return cls(base, [{name: columns[name][i] for name in ranges} for i in range(n)])
+
+
+    @classmethod
+    def lhs(cls, base, n, seed=None, **ranges):
+        """
+        `n` points of a Latin hypercube: every (low, high) range is split into `n` equal intervals and each of them is sampled exactly once.
+        Lists of options are stratified the same way, each option is used about `n / len(options)` times.
+
+        `seed`, int: seed of the random number generator
+        """
+        rng = np.random.default_rng(seed)
+        strata = np.arange(n)
+        columns = {}
+        for name, spec in ranges.items():
+            if _is_range(spec):
+                low, high = spec
+                columns[name] = (low + (rng.permutation(strata) + rng.uniform(size=n)) * (high - low) / n).tolist()
+            else:
+                options = _options(name, spec)
+                columns[name] = [options[i] for i in rng.permutation(strata * len(options) // n)]
+
+        return cls(base, [{name: columns[name][i] for name in ranges} for i in range(n)])
+
+
+    def __len__(self):
+        return len(self.points)
+
+
+    def run(self, pexo, max_workers=None, strict=True, **args):
+        """
+        Emulate all the points in parallel with `pexo` (a `Pexo` instance), `args` are the PEXO arguments shared by all of them (primary, time, ...).
+
+        Returns a single numpy structured array with the rows of all the emulations:
+        the index of the point in `points` ("point"), the varied parameters and the columns of the PEXO output.
+
+        `max_workers`, int: number of emulations to run at the same time, see `Pexo.run_many`
+
+        `strict`, bool: raise the error of the first failed point, otherwise failed points are left out of the table and kept in `failed`
+        """
+        for key in ("m", "mode", "P", "par", "o", "out"):
+            if key in args:
+                raise ValueError("'{}' is set by the sweep and can't be passed to Sweep.run".format(key))
+
+        jobs = [dict(args, mode="emulate", par=self._merge(point)) for point in self.points]
+        tables = {}
+        self.failed = {}
+        for result in pexo.run_many(jobs, max_workers=max_workers):
+            if not result.ok:
+                self.failed[result.index] = result.error
+                continue
+            tables[result.index] = _take_table(result.output)
+
+        if strict and len(self.failed) > 0:
+            raise self.failed[min(self.failed)]
+
+        return self._stack(tables)
+
+
+    def _merge(self, point):
+        par = dict(self.base.contents)
+        par.update(point)
+        return par
+
+
+    def _stack(self, tables):
+        """
+        Stacks the output tables (point index -> structured array) into one, with the point index and parameter values prepended to every row.
+        """
+        indices = sorted(tables)
+        if len(indices) == 0:
+            return np.empty(0, dtype=[("point", np.int64)] + [(name, self._dtype(name)) for name in self.parameters])
+
+        columns = tables[indices[0]].dtype.descr
+        dtype = [("point", np.int64)] + [(name, self._dtype(name)) for name in self.parameters] + columns
+        stacked = np.empty(sum(len(tables[i]) for i in indices), dtype=dtype)
+
+        start = 0
+        for i in indices:
+            table, stop = tables[i], start + len(tables[i])
+            rows = stacked[start:stop]
+            rows["point"] = i
+            for name in self.parameters:
+                rows[name] = self.points[i][name]
+            for name in table.dtype.names:
+                rows[name] = table[name]
+            start = stop
+
+        return stacked
+
+
+    def _dtype(self, name):
+        param_type = ParFile._par[name]["type"]
+        if param_type == numbers.Number:
+            return np.float64
+        if param_type == bool:
+            return np.bool_
+        return "U{}".format(max(len(str(point[name])) for point in self.points) if len(self.points) > 0 else 1)
+
+
+
+def _is_range(spec):
+    return isinstance(spec, tuple) and len(spec) == 2 and all(isinstance(x, numbers.Number) for x in spec)
+
+
+def _normalise(name, value):
+    # values as they are stored in the result table, e.g. "true" -> True
+    param_type = ParFile._par.get(name, {}).get("type")
+    if param_type == bool and isinstance(value, str):
+        return value.lower() == "true" if value.lower() in ("true", "false") else value
+    if param_type == numbers.Number and isinstance(value, (str, numbers.Number)) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def _options(name, spec):
+    if name not in ParFile._par:
+        raise KeyError("Unknown parameter '{}'.".format(name))
+
+    if spec is None:
+        if ParFile._par[name]["options"] is None:
+            raise ValueError("Parameter '{}' has no set options, specify the values to use.".format(name))
+        return list(ParFile._par[name]["options"])
+
+    if _is_range(spec):
+        raise ValueError("A (low, high) range can only be sampled with Sweep.random or Sweep.lhs, use a list of values for '{}'.".format(name))
+    return list(spec)
+
+
+def _take_table(output):
+    """
+    Reads the table of an emulation output and removes its files, the table is kept in the stacked result only.
+    """
+    if output.path is None: # kept in memory
+        return output.contents
+
+    table = load_table(output.path, sidecar=False)
+    remove_output(output.path)
+    return table
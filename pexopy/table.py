@@ -0,0 +1,230 @@
+import os
+import re
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+_chunk_size = 32 * 2**20 # bytes of text parsed at once
+_na_pattern = re.compile(rb"(?<!\S)NA(?!\S)")
+_name_pattern = re.compile(r"[^0-9A-Za-z_]")
+
+
+def sidecar_path(path):
+    """
+    Path of the binary copy of the table in `path`.
+    """
+    return path + ".npy"
+
+
+def read_header(path):
+    """
+    Column names of the table in `path`, normalised the same way as `numpy.genfromtxt(names=True)` does.
+    """
+    with open(path, "rb") as f:
+        header = f.readline().decode("ascii")
+    return column_names(header.lstrip("#").split())
+
+
+def column_names(names):
+    """
+    Normalises column `names` the same way as `numpy.genfromtxt(names=True)` does.
+    """
+    return [_name_pattern.sub("", str(name)) for name in names]
+
+
+def open_sidecar(path):
+    """
+    Memory-maps the binary copy of the table in `path`, returns None if there isn't one or it's older than the table.
+    """
+    binary = sidecar_path(path)
+    if os.path.isfile(binary) and os.path.getmtime(binary) >= os.path.getmtime(path):
+        try:
+            return np.load(binary, mmap_mode="c")
+        except ValueError: # corrupted or incompatible file
+            pass
+    return None
+
+
+def load_table(path, sidecar=True, workers=1, columns=None, dtype=None):
+    """
+    Read a PEXO output table (whitespace-separated numbers with a header line) into a numpy structured array with float columns, the same as `numpy.genfromtxt(path, names=True)`.
+
+    `sidecar`, bool: keep a binary copy of the table next to it (`path` + ".npy") and memory-map it instead of parsing the text when it's up to date. The copy is only written when the whole table is read.
+
+    `workers`, int: number of processes to parse the text with
+
+    `columns`, list: names of the columns to read, all of them by default
+
+    `dtype`, numpy dtype: type of the columns, float64 by default
+    """
+    table = open_sidecar(path) if sidecar else None
+    if table is not None:
+        return select(table, columns, dtype)
+
+    table = read_table(path, workers=workers, columns=columns, dtype=dtype)
+
+    if sidecar and columns is None and dtype is None:
+        binary = sidecar_path(path)
+        try:
+            partial = "{}.{}.part".format(binary, os.getpid())
+            with open(partial, "wb") as f:
+                np.save(f, table)
+            os.replace(partial, binary)
+        except OSError: # read-only location, just skip the sidecar
+            pass
+
+    return table
+
+
+def write_table(path, table, sidecar=True):
+    """
+    Write a structured array to `path` in the PEXO output format (a header line and whitespace-separated numbers).
+
+    `sidecar`, bool: also save the binary copy of the table, see `load_table`
+    """
+    names = table.dtype.names
+    with open(path, "w") as f:
+        f.write(" ".join(names) + "\n")
+        values = np.column_stack([table[name] for name in names]) if len(table) > 0 else np.empty((0, len(names)))
+        np.savetxt(f, values, fmt="%.17g")
+
+    if sidecar:
+        with open(sidecar_path(path), "wb") as f:
+            np.save(f, np.ascontiguousarray(table))
+
+
+def select(table, columns=None, dtype=None):
+    """
+    Selects `columns` of a structured array and casts them to `dtype`, without a copy if neither is needed.
+    """
+    if columns is not None:
+        table = table[list(columns)]
+    if dtype is not None:
+        table = np.asarray(table).astype([(name, dtype) for name in table.dtype.names])
+    return table
+
+
+def read_table(path, workers=1, chunk_size=None, columns=None, dtype=None):
+    """
+    Parse a PEXO output table into a numpy structured array.
+
+    The text is parsed with the compiled `numpy.loadtxt` parser in chunks of `chunk_size` bytes, so the memory used on top of the table itself is bounded.
+    With `workers` > 1 the chunks are parsed in separate processes.
+    Falls back to `numpy.genfromtxt` for tables that are not purely numeric.
+    """
+    chunk_size = _chunk_size if chunk_size is None else chunk_size
+    dtype = np.dtype(float if dtype is None else dtype)
+    names, ranges = _scan(path, chunk_size)
+    usecols, names = _usecols(names, columns)
+
+    try:
+        data = np.empty((sum(nlines for _, _, nlines in ranges), len(names)), dtype=dtype)
+        filled = 0
+
+        if workers > 1 and len(ranges) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                n = len(ranges)
+                parts = executor.map(_parse_range, [path] * n, ranges, [usecols] * n, [dtype] * n)
+                for part in parts:
+                    filled = _fill(data, filled, part)
+        else:
+            for chunk_range in ranges:
+                filled = _fill(data, filled, _parse_range(path, chunk_range, usecols, dtype))
+
+    except ValueError:
+        return select(np.genfromtxt(path, names=True), columns, dtype)
+
+    return data[:filled].view([(name, dtype) for name in names]).reshape(filled)
+
+
+def iter_table(path, rows, sidecar=True, columns=None, dtype=None):
+    """
+    Generator of consecutive blocks of `rows` rows of the table in `path` as numpy structured arrays, without reading the whole table into memory.
+
+    Blocks are slices of the memory-mapped binary copy if there is one (see `load_table`), otherwise they are parsed from the text one by one.
+    """
+    if rows < 1:
+        raise ValueError("Number of rows in a block should be a positive number.")
+
+    table = open_sidecar(path) if sidecar else None
+    if table is not None:
+        for start in range(0, len(table), rows):
+            yield select(table[start:start + rows], columns, dtype)
+        return
+
+    dtype = np.dtype(float if dtype is None else dtype)
+    usecols, names = _usecols(read_header(path), columns)
+    fields = [(name, dtype) for name in names]
+
+    with open(path, "rb") as f:
+        f.readline() # header
+        while True:
+            text = b"".join(itertools.islice(f, rows))
+            if not text:
+                break
+
+            block = _parse_text(text, usecols, dtype)
+            if len(block) > 0:
+                yield np.ascontiguousarray(block).view(fields).reshape(len(block))
+
+
+def _usecols(names, columns):
+    if columns is None:
+        return None, names
+
+    missing = [name for name in columns if name not in names]
+    if len(missing) > 0:
+        raise KeyError("Columns not found in the table: {}".format(", ".join(missing)))
+
+    return [names.index(name) for name in columns], list(columns)
+
+
+def _fill(data, filled, part):
+    if len(part) == 0:
+        return filled
+    if part.shape[1] != data.shape[1]:
+        raise ValueError("Number of columns does not match the header.")
+    data[filled:filled + len(part)] = part
+    return filled + len(part)
+
+
+def _parse_range(path, chunk_range, usecols=None, dtype=float):
+    start, end, _ = chunk_range
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start)
+    return _parse_text(text, usecols, dtype)
+
+
+def _parse_text(text, usecols=None, dtype=float):
+    if b"NA" in text:
+        text = _na_pattern.sub(b"nan", text)
+
+    lines = text.decode("ascii").splitlines()
+    if len(lines) == 0:
+        return np.empty((0, 0), dtype=dtype)
+    return np.loadtxt(lines, ndmin=2, usecols=usecols, dtype=dtype)
+
+
+def _scan(path, chunk_size):
+    """
+    Returns column names and a list of (start, end, number of lines) byte ranges of the table body, split on line ends.
+    """
+    names = read_header(path)
+    with open(path, "rb") as f:
+        f.readline() # header
+
+        ranges = []
+        start = f.tell()
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+
+            tail = b"" if block.endswith(b"\n") else f.readline()
+            block += tail
+            ranges.append((start, start + len(block), block.count(b"\n") + (not block.endswith(b"\n"))))
+            start += len(block)
+
+    return names, ranges
@@ -0,0 +1,256 @@
+import os
+import re
+import uuid
+import shutil
+import itertools
+import threading
+
+from .settings import get_temp_storage, get_temp_max_size
+
+try:
+    import fcntl
+except ImportError: # not on Windows, scratch folders are owned by the pid there
+    fcntl = None
+
+
+_runs_folder = "runs"
+_shared_pattern = re.compile(r"^(pexopy-temp-)?[0-9a-f]{32}\.\w+$") # files named by UniqueFile
+_partial_pattern = re.compile(r"\.(\d+)-\d+\.part$")
+_scratch_pattern = re.compile(r"^(\d+)-([0-9a-f]{8})(-\d+|\.lock)$") # <pid>-<token>-<n> folders and <pid>-<token>.lock files
+_legacy_pattern = re.compile(r"^\d+-\d+$") # <pid>-<n> folders of earlier versions
+_run_ids = itertools.count()
+_janitor_lock = threading.Lock()
+_shared_lock = threading.Lock() # links to the shared files are made and released one at a time within the process
+_janitor_done = False
+_owners = {} # (pid, runs folder) -> (owner name, open lock file) of this process
+
+
+class ScratchDir(object):
+    """
+    Private temporary folder of a single PEXO run, <temp storage>/runs/<pid>-<token>-<n>, created on first use.
+
+    The process holds a lock on <temp storage>/runs/<pid>-<token>.lock while it is running, so that the folders of processes
+    that have exited can be told apart from the running ones even when their pid has been reused, see `janitor`.
+
+    Input files generated from the arguments are shared by all the runs (and processes) in the temp storage root, named by the hash of their contents.
+    A run uses them through hard links in its scratch folder, so the number of links of a shared file is the number of runs using it plus one,
+    and files with a single link can be removed safely. Unused files are kept for the next runs with the same inputs, and only removed
+    (the least recently used first) when the storage is over its size limit or by `PexoArguments.clear_temp(nuke=True)`, see `evict`.
+    """
+    def __init__(self):
+        self._path = None
+        self.files = []
+
+
+    @property
+    def path(self):
+        if self._path is None:
+            janitor(once=True)
+            runs = os.path.join(get_temp_storage(), _runs_folder)
+            path = os.path.join(runs, "{}-{}".format(_owner_name(runs), next(_run_ids)))
+            os.makedirs(path)
+            self._path = path
+        return self._path
+
+
+    def link(self, create):
+        """
+        Link a shared file into this folder, returns the path of the link.
+
+        `create`: function that creates the shared file if needed (e.g. `UniqueFile`) and returns its path
+        """
+        for _ in range(3):
+            with _shared_lock:
+                shared = create()
+                path = os.path.join(self.path, os.path.basename(shared))
+                try:
+                    if not os.path.isfile(path):
+                        os.link(shared, path)
+                    os.utime(shared) # most recently used, evicted last
+                except FileNotFoundError: # removed by a run in another process in the meantime, create it again
+                    continue
+                except OSError: # no hard links on this file system, use a private copy
+                    shutil.copyfile(shared, path)
+
+            if path not in self.files:
+                self.files.append(path)
+            evict()
+            return path
+
+        raise FileNotFoundError("Could not create a temporary file in {}".format(get_temp_storage()))
+
+
+    def release(self):
+        """
+        Remove the links of this run, and the folder itself if there are no other files in it (e.g. a default output).
+
+        The shared files are kept for the next runs with the same inputs, see `evict`.
+        """
+        with _shared_lock:
+            for path in self.files:
+                if os.path.isfile(path):
+                    os.remove(path)
+        self.files = []
+
+        if self._path is not None:
+            try:
+                os.rmdir(self._path)
+                self._path = None
+            except OSError: # not empty
+                pass
+
+
+
+def remove_output(path):
+    """
+    Remove an output file and its binary copy, and the scratch folder it is in if that is empty now.
+    """
+    for file_path in (path, path + ".npy"):
+        if os.path.isfile(file_path):
+            os.remove(file_path)
+
+    folder = os.path.dirname(os.path.abspath(path))
+    if os.path.dirname(folder) == os.path.join(get_temp_storage(), _runs_folder):
+        try:
+            os.rmdir(folder)
+        except OSError: # not empty or already removed
+            pass
+
+
+def storage_size():
+    """
+    Total size of the files in the temp storage, bytes.
+    """
+    root = get_temp_storage()
+    size = 0
+    for folder, _, files in os.walk(root):
+        for name in files:
+            try:
+                stat = os.lstat(os.path.join(folder, name))
+            except FileNotFoundError:
+                continue
+            if folder == root or stat.st_nlink == 1: # links to the shared files are counted once, in the root
+                size += stat.st_size
+    return size
+
+
+def evict(max_size=None):
+    """
+    Remove unused shared files from the temp storage, the least recently used first, until it is smaller than `max_size` bytes
+    (`get_temp_max_size()` by default, nothing is removed if there's no limit).
+    """
+    max_size = get_temp_max_size() if max_size is None else max_size
+    if max_size is None:
+        return
+
+    size = storage_size()
+    if size <= max_size:
+        return
+
+    root = get_temp_storage()
+    unused = []
+    for name in os.listdir(root):
+        if not _shared_pattern.match(name):
+            continue
+        try:
+            stat = os.stat(os.path.join(root, name))
+        except FileNotFoundError:
+            continue
+        if stat.st_nlink == 1:
+            unused.append((stat.st_mtime, stat.st_size, name))
+
+    for _, file_size, name in sorted(unused):
+        if size <= max_size:
+            break
+        try:
+            os.remove(os.path.join(root, name))
+            size -= file_size
+        except FileNotFoundError:
+            pass
+
+
+def janitor(once=False):
+    """
+    Remove scratch folders (with the default outputs in them) and partially written files left by processes that are not running anymore,
+    i.e. that have exited or crashed.
+
+    `once`, bool: do nothing if the janitor has already run in this process
+    """
+    global _janitor_done
+    with _janitor_lock:
+        if once and _janitor_done:
+            return
+        _janitor_done = True
+
+    root = get_temp_storage()
+    runs = os.path.join(root, _runs_folder)
+    if os.path.isdir(runs):
+        names = os.listdir(runs)
+        owners = set(match.group(1, 2) for match in map(_scratch_pattern.match, names) if match)
+        gone = set(owner for owner in owners if not _owner_running(runs, *owner))
+        for name in names:
+            match = _scratch_pattern.match(name)
+            if match and match.group(1, 2) in gone and match.group(3) != ".lock":
+                shutil.rmtree(os.path.join(runs, name), ignore_errors=True)
+            elif _legacy_pattern.match(name) and not _is_running(int(name.split("-")[0])):
+                shutil.rmtree(os.path.join(runs, name), ignore_errors=True)
+        for pid, token in gone: # last, so that the folders are never seen without their lock
+            try:
+                os.remove(os.path.join(runs, "{}-{}.lock".format(pid, token)))
+            except FileNotFoundError:
+                pass
+
+    for name in os.listdir(root):
+        match = _partial_pattern.search(name)
+        if match and not _is_running(int(match.group(1))):
+            try:
+                os.remove(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+
+
+def _owner_name(runs):
+    """
+    Name of this process in the scratch folders of `runs`, <pid>-<token>, its lock file is created and locked on first use.
+    """
+    with _janitor_lock:
+        key = (os.getpid(), runs) # a forked child gets its own name
+        if key not in _owners:
+            name = "{}-{}".format(os.getpid(), uuid.uuid4().hex[:8])
+            os.makedirs(runs, exist_ok=True)
+            lock = None
+            if fcntl is not None:
+                lock = open(os.path.join(runs, name + ".lock"), "a")
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB) # held until the process exits
+            _owners[key] = (name, lock)
+        return _owners[key][0]
+
+
+def _owner_running(runs, pid, token):
+    """
+    Whether the process that named its scratch folders <pid>-<token> is still running, i.e. still holds its lock file.
+    """
+    if fcntl is None:
+        return _is_running(int(pid))
+    try:
+        lock = open(os.path.join(runs, "{}-{}.lock".format(pid, token)), "r")
+    except FileNotFoundError: # the lock file is created before the folders, they are being removed by another janitor
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError: # locked by its owner
+            return True
+    return False
+
+
+def _is_running(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError: # running, as another user
+        return True
+    return True
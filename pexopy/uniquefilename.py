@@ -1,21 +1,76 @@
 import os
 import hashlib
-from .settings import temp_storage
+import threading
+import numpy as np
+from .settings import get_temp_storage
 
 class UniqueFile(str):
     """
     Generates an MD5 hash from the `contents` (<str>) and returns a string in a format f'{prepend}{md5}{append}'
+
+    If `create` is set, the file is written unless it already exists. Since the name is derived from the contents, an existing file is reused as is.
     """
     def __new__(cls, contents, prepend="", append="", folder=None, create=True, *args, **kwargs):
         if folder is None:
-            folder = temp_storage
+            folder = get_temp_storage()
 
         md5 = hashlib.md5(contents.encode("utf-8")).hexdigest()
         name = "{}{}{}".format(prepend, md5, append)
         path = os.path.join(folder, name)
 
-        if create:
-            with open(path, "w") as f:
-                f.write(contents)
-        
+        if create and not os.path.isfile(path):
+            _write_atomically(path, lambda f: f.write(contents))
+
         return str.__new__(cls, path)
+
+
+
+class UniqueArrayFile(str):
+    """
+    Same as `UniqueFile` for a numpy `array` of numbers (1D, or 2D with one row per line), written as whitespace-separated text.
+
+    The MD5 hash is computed from the array data, so an existing file for the same array is found without formatting the numbers.
+    The text is written in blocks of `chunk_rows` rows, without building the whole file in memory.
+    """
+    chunk_rows = 2**16
+
+    def __new__(cls, array, prepend="", append="", folder=None, create=True, *args, **kwargs):
+        if folder is None:
+            folder = get_temp_storage()
+
+        array = np.ascontiguousarray(array)
+        md5 = hashlib.md5("{} {}\n".format(array.dtype.str, array.shape).encode("ascii"))
+        md5.update(array.data)
+        name = "{}{}{}".format(prepend, md5.hexdigest(), append)
+        path = os.path.join(folder, name)
+
+        if create and not os.path.isfile(path):
+            def write(f):
+                for start in range(0, len(array), cls.chunk_rows):
+                    f.write(_format_rows(array[start:start + cls.chunk_rows]))
+                    f.write("\n")
+
+            _write_atomically(path, write)
+
+        return str.__new__(cls, path)
+
+
+
+def _format_rows(rows):
+    # repr is the shortest text that reads back as the same float, and the fastest way to format them
+    if rows.ndim == 1:
+        return "\n".join(map(repr, rows.tolist()))
+    return "\n".join(" ".join(map(repr, row)) for row in rows.tolist())
+
+
+def _write_atomically(path, write):
+    # write to a private file first so that parallel runs never see a partially written file
+    partial = "{}.{}-{}.part".format(path, os.getpid(), threading.get_ident())
+    try:
+        with open(partial, "w") as f:
+            write(f)
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.isfile(partial):
+            os.remove(partial)
+        raise
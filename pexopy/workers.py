@@ -0,0 +1,186 @@
+import os
+import itertools
+import threading
+from subprocess import Popen, PIPE, STDOUT
+
+from .settings import module_path
+
+
+worker_script = os.path.join(module_path, "R", "worker.R")
+
+
+class RWorker(object):
+    """
+    A single long-lived R process that has PEXO code directory as its working directory and runs PEXO jobs sent through its stdin (see `R/worker.R`).
+
+    `Rscript`, str: path to Rscript
+
+    `code_dir`, str: path to PEXO `code` directory
+
+    `verbose`, bool: whether to show the PEXO stdout
+    """
+    _done_marker = "@@pexopy-done"
+    _job_ids = itertools.count()
+
+    def __init__(self, Rscript, code_dir, verbose=False):
+        self.jobs = 0
+        self.verbose = verbose
+        self._process = Popen(
+            [Rscript, worker_script, code_dir],
+            cwd=code_dir, stdin=PIPE, stdout=PIPE, stderr=STDOUT,
+            universal_newlines=True, bufsize=1
+        )
+
+
+    @property
+    def alive(self):
+        return self._process.poll() is None
+
+
+    def run(self, argv):
+        """
+        Run PEXO with the command line arguments `argv` (list of str) and wait for it to finish.
+
+        Returns PEXO exit status, or None if the worker died during the job.
+        """
+        job_id = str(next(RWorker._job_ids))
+        self.jobs += 1
+
+        try:
+            self._process.stdin.write("\t".join([job_id] + list(argv)) + "\n")
+            self._process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            return None
+
+        for line in self._process.stdout:
+            if line.startswith(RWorker._done_marker):
+                _, done_id, status = line.split()
+                if done_id == job_id:
+                    return int(status)
+            elif self.verbose:
+                print(line, end="")
+
+        return None # EOF -- the R process has died
+
+
+    def close(self):
+        """
+        Stop the R process.
+        """
+        if self.alive:
+            try:
+                self._process.stdin.write("\n")
+                self._process.stdin.flush()
+                self._process.wait(timeout=5)
+            except Exception:
+                self._process.kill()
+                self._process.wait()
+
+
+
+class WorkerPool(object):
+    """
+    A pool of warm R workers for `Pexo.run`.
+
+    Workers are started on demand, up to `size` of them, and are replaced with fresh ones after `recycle` jobs or if they crash.
+
+    `Rscript`, str: path to Rscript
+
+    `code_dir`, str: path to PEXO `code` directory
+
+    `size`, int: maximum number of R processes
+
+    `recycle`, int: number of jobs after which a worker is restarted
+
+    `verbose`, bool: whether to show the PEXO stdout
+    """
+    def __init__(self, Rscript, code_dir, size=1, recycle=50, verbose=False):
+        if size < 1:
+            raise ValueError("Worker pool size should be a positive number.")
+
+        self.Rscript  = Rscript
+        self.code_dir = code_dir
+        self.size     = size
+        self.recycle  = recycle
+        self.verbose  = verbose
+
+        self._condition = threading.Condition()
+        self._idle      = []
+        self._workers   = []
+
+
+    def run(self, argv):
+        """
+        Run PEXO with the command line arguments `argv` (list of str) on an idle worker, blocks until one is available.
+
+        Returns PEXO exit status.
+        """
+        worker = self._acquire()
+        try:
+            rc = worker.run(argv)
+        except BaseException:
+            self._discard(worker)
+            raise
+
+        if rc is None:
+            self._discard(worker)
+            raise ChildProcessError("PEXO worker process has crashed while running a job.")
+
+        if worker.jobs >= self.recycle:
+            self._discard(worker)
+        else:
+            self._release(worker)
+
+        return rc
+
+
+    def close(self):
+        """
+        Stop all the workers.
+        """
+        with self._condition:
+            workers, self._workers, self._idle = self._workers, [], []
+            self._condition.notify_all()
+
+        for worker in workers:
+            worker.close()
+
+
+    def _acquire(self):
+        with self._condition:
+            while not self._idle and len(self._workers) >= self.size:
+                self._condition.wait()
+
+            if self._idle:
+                return self._idle.pop()
+
+            worker = RWorker(self.Rscript, self.code_dir, verbose=self.verbose)
+            self._workers.append(worker)
+            return worker
+
+
+    def _release(self, worker):
+        with self._condition:
+            pooled = worker in self._workers
+            if pooled:
+                self._idle.append(worker)
+            self._condition.notify()
+
+        if not pooled: # the pool has been closed while the job was running
+            worker.close()
+
+
+    def _discard(self, worker):
+        worker.close()
+        with self._condition:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            self._condition.notify()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc):
+        self.close()
@@ -6,8 +6,9 @@ setup(
     author="Maksym Lisogorskyi",
     author_email="m.lisogorskyi@gmail.com",
     packages=["pexopy"],
+    package_data={"pexopy": ["R/*.R"]},
     install_requires=["numpy", "rpy2"],
-    python_requires='>=3.6',
+    python_requires='>=3.7',
     version="0.2",
     license="MIT",
     description="A python wrapper for PEXO software",
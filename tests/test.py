@@ -1,8 +1,26 @@
-import sys, os
+import sys, os, time
 sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
 
+import asyncio
 import unittest
-from pexopy import Pexo, FitOutput, EmulationOutput
+import tempfile
+import threading
+import numpy as np
+from pexopy import Pexo, ParFile, FitOutput, EmulationOutput, ResultCache, Sweep, MultiChainFit, ResourceLimits, PexoProcessError, CoreBudget, stack_parstat, FitCollection, get_temp_storage, set_temp_storage, metrics
+from pexopy.cluster import Coordinator, ClusterWorker
+from pexopy.tempstore import evict
+from pexopy.uniquefilename import UniqueArrayFile
+from pexopy.incremental import epoch_rows, match_epochs, merge_epochs
+from pexopy.multichain import split_rhat, effective_sample_size
+
+stub_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "stub")
+
+
+def stub_pexo(**kwargs):
+    """
+    Pexo running the stub PEXO of the benchmarks, for the tests that don't need R or PEXO.
+    """
+    return Pexo(Rscript=os.path.join(stub_dir, "Rscript"), pexodir=os.path.join(stub_dir, "pexo"), verbose=False, **kwargs)
 
 
 class PexopyArgumentsTest(unittest.TestCase):
@@ -29,5 +47,441 @@ class PexopyArgumentsTest(unittest.TestCase):
         self.assertIsInstance(output, FitOutput)
 
 
+    def test_emulate_workers(self):
+        print("Running two test emulations on a warm R worker")
+        with Pexo(verbose=False, workers=1, recycle=2) as pexo:
+            for _ in range(2):
+                output = pexo.run(
+                    mode="emulate",
+                    primary="HD128621",
+                    ins="HARPS",
+                    time="2450000 2453000 10"
+                )
+                self.assertIsInstance(output, EmulationOutput)
+
+
+    def test_emulate_embedded(self):
+        print("Running a test emulation in the embedded R session, this should take <1min")
+        output = Pexo(verbose=False, backend="embedded").run(
+            mode="emulate",
+            primary="HD128621",
+            ins="HARPS",
+            time="2450000 2453000 10"
+        )
+        self.assertIsInstance(output, EmulationOutput)
+        self.assertIsNone(output.path)
+        self.assertEqual(len(output.contents), 301)
+
+
+    def test_run_many(self):
+        print("Running a batch of test emulations, this should take <1min")
+        jobs = [
+            dict(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000 + i, 2450010 + i])
+            for i in range(4)
+        ] + [dict(mode="emulate", primary="HD128621", ins="HARPS", time="not a time")]
+
+        results = list(Pexo(verbose=False).run_many(jobs, max_workers=2))
+        self.assertEqual(sorted(result.index for result in results), list(range(len(jobs))))
+        for result in results:
+            if result.index < 4:
+                self.assertTrue(result.ok)
+                self.assertIsInstance(result.output, EmulationOutput)
+            else:
+                self.assertFalse(result.ok)
+
+
+    def test_run_many_budget(self):
+        print("Running a batch of test emulations within a budget of 2 cores, this should take <1min")
+        budget = CoreBudget(cores=2, path=os.path.join(tempfile.mkdtemp(), "cores.json"))
+        jobs = [dict(mode="emulate", primary="HD128621", ins="HARPS", time="2450000 2451000 10", ncore=n) for n in (2, 1, 1)]
+
+        results = list(Pexo(verbose=False, budget=budget).run_many(jobs, max_workers=3))
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertIn("queue", result.output.stats.phases)
+        self.assertEqual(budget.status()["used"], 0)
+
+
+    def test_cluster(self):
+        print("Running test emulations on two cluster workers on localhost, one of them crashing, this should take <1min")
+        jobs = [dict(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000 + i, 2450010 + i]) for i in range(4)]
+
+        with Coordinator(timeout=5) as coordinator:
+            def crash(**args):
+                crashing._connection.close()
+                raise SystemExit
+
+            crashing = ClusterWorker(coordinator.address, authkey=coordinator.authkey, runner=crash)
+            workers = [crashing] + [ClusterWorker(coordinator.address, authkey=coordinator.authkey) for _ in range(2)]
+            threads = [threading.Thread(target=worker.run) for worker in workers]
+            for thread in threads:
+                thread.start()
+
+            results = list(coordinator.run_many(jobs))
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(result.index for result in results), list(range(len(jobs))))
+        for result in results:
+            self.assertTrue(result.ok)
+            self.assertIsInstance(result.output, EmulationOutput)
+
+
+    def test_cluster_late_result(self):
+        print("Running a job that misses its heartbeats on a cluster worker, and sending its result after it has been requeued")
+        calls = []
+
+        def runner(**args):
+            calls.append(args["n"])
+            if len(calls) == 1:
+                time.sleep(3) # the job is requeued after 1s, its result is sent late
+            return args["n"]
+
+        with Coordinator(timeout=1) as coordinator:
+            worker = ClusterWorker(coordinator.address, authkey=coordinator.authkey, runner=runner, heartbeat=60)
+            thread = threading.Thread(target=worker.run)
+            thread.start()
+            results = list(coordinator.run_many([dict(n=0), dict(n=1)]))
+        thread.join()
+
+        self.assertEqual(sorted(result.index for result in results), [0, 1])
+        self.assertEqual(calls, [0, 1])
+        for result in results:
+            self.assertEqual(result.output, result.index)
+
+
+    def test_time_file_reuse(self):
+        print("Running a stub emulation of the same epochs twice and checking that the .tim file is reused")
+        previous = get_temp_storage()
+        with tempfile.TemporaryDirectory() as folder:
+            set_temp_storage(os.path.join(folder, "tmp"))
+            try:
+                pexo = stub_pexo()
+                inodes = []
+                for _ in range(2):
+                    output = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010, 2450020], out=os.path.join(folder, "out.txt"))
+                    self.assertEqual(len(output.contents), 3)
+                    files = [name for name in os.listdir(get_temp_storage()) if name.endswith(".tim")]
+                    self.assertEqual(len(files), 1)
+                    inodes.append(os.stat(os.path.join(get_temp_storage(), files[0])).st_ino)
+                self.assertEqual(inodes[0], inodes[1])
+
+                evict(max_size=0)
+                self.assertEqual([name for name in os.listdir(get_temp_storage()) if name.endswith(".tim")], [])
+            finally:
+                set_temp_storage(previous)
+
+
+    def test_unique_array_file(self):
+        print("Writing arrays to files named by their contents")
+        with tempfile.TemporaryDirectory() as folder:
+            epochs = 2450000 + np.arange(10) / 3
+            path = UniqueArrayFile(epochs, append=".tim", folder=folder)
+            self.assertTrue(path.endswith(".tim"))
+            self.assertEqual(np.loadtxt(path).tolist(), epochs.tolist()) # written exactly
+
+            os.utime(path, ns=(0, 0))
+            self.assertEqual(UniqueArrayFile(epochs.copy(), append=".tim", folder=folder), path)
+            self.assertEqual(os.stat(path).st_mtime_ns, 0) # found by the name, not written again
+
+            self.assertNotEqual(UniqueArrayFile(epochs[::-1], append=".tim", folder=folder), path)
+            self.assertNotEqual(UniqueArrayFile(epochs.astype(np.float32), append=".tim", folder=folder), path)
+            self.assertNotEqual(UniqueArrayFile(epochs.reshape(5, 2), append=".tim", folder=folder), path)
+            self.assertFalse(os.path.isfile(UniqueArrayFile(epochs + 1, append=".tim", folder=folder, create=False)))
+
+            chunk_rows, UniqueArrayFile.chunk_rows = UniqueArrayFile.chunk_rows, 3 # written in several blocks
+            try:
+                rows = np.column_stack([np.floor(epochs), epochs % 1])
+                self.assertEqual(np.loadtxt(UniqueArrayFile(rows, folder=folder)).tolist(), rows.tolist())
+            finally:
+                UniqueArrayFile.chunk_rows = chunk_rows
+            self.assertEqual([name for name in os.listdir(folder) if name.endswith(".part")], [])
+
+
+    def test_parfile_cache(self):
+        print("Building the same ParFile twice and parsing a .par file again after it changes")
+        first = ParFile(dict(RefType="none", TtTdbMethod="eph"))
+        second = ParFile(dict(RefType="none", TtTdbMethod="eph"))
+        self.assertEqual(second.path, first.path)
+        self.assertIn((("RefType", str, "none"), ("TtTdbMethod", str, "eph")), ParFile._texts)
+        with self.assertRaises(ValueError):
+            ParFile(dict(RefType=["none"]))
+
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "test.par")
+            with open(path, "w") as f:
+                f.write("RefType none\n")
+            self.assertEqual(ParFile(path).contents, dict(RefType="none"))
+
+            with open(path, "w") as f: # different size
+                f.write("RefType refro\n")
+            self.assertEqual(ParFile(path).contents, dict(RefType="refro"))
+
+            with open(path, "w") as f: # same size, different modification time
+                f.write("RefType refco\n")
+            os.utime(path, ns=(0, 10**9))
+            self.assertEqual(ParFile(path).contents, dict(RefType="refco"))
+
+
+    def test_metrics(self):
+        print("Running a valid, an invalid and a split stub emulation and checking the metrics registry")
+        metrics.reset()
+        pexo = stub_pexo()
+        pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010])
+        with self.assertRaises(ValueError):
+            pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time="not a time")
+
+        counters = metrics.to_json()["counters"]
+        runs = {counter["labels"]["status"]: counter["value"] for counter in counters if counter["name"] == "pexopy_runs_total"}
+        failures = [counter for counter in counters if counter["name"] == "pexopy_run_failures_total"]
+        self.assertEqual(runs, dict(ok=1, error=1))
+        self.assertEqual([counter["labels"]["error"] for counter in failures], ["ValueError"])
+
+        metrics.reset()
+        pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010, 2450020, 2450030], split=2)
+        histograms = {h["labels"]["phase"]: h["count"] for h in metrics.to_json()["histograms"] if h["name"] == "pexopy_phase_seconds"}
+        self.assertEqual(histograms["pexo"], 1) # the chunks are not counted on their own
+        self.assertEqual([counter["value"] for counter in metrics.to_json()["counters"] if counter["name"] == "pexopy_runs_total"], [1])
+
+
+    def test_emulate_split(self):
+        print("Running a stub emulation of unsorted epochs in one piece and split into uneven chunks")
+        epochs = [2450030, 2450000, 2450090, 2450010, 2450070, 2450020, 2450080, 2450050, 2450040, 2450060]
+        pexo = stub_pexo()
+        single = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=epochs)
+        for split in (3, 4, 20): # chunks of 4, 3, 3 epochs, 3, 3, 2, 2 epochs, and more chunks than epochs
+            output = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=epochs, split=split)
+            self.assertEqual(output.contents.dtype.names, single.contents.dtype.names)
+            self.assertEqual(output.contents["JDutc"].tolist(), single.contents["JDutc"].tolist())
+            self.assertEqual(output.contents["JDutc"].tolist(), epochs)
+
+
+    def test_emulation_output_columns(self):
+        print("Reading single columns and a selection of columns of a stub emulation output")
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "out.txt")
+            stub_pexo().run(mode="emulate", primary="HD128621", ins="HARPS", time=list(range(2450000, 2450010)), out=path)
+
+            selected = EmulationOutput(path, columns=["JDutc", "col2"], dtype=np.float32)
+            self.assertEqual(selected.names, ["JDutc", "col2"])
+            self.assertEqual(selected["col2"].dtype, np.float32)
+            with self.assertRaises(KeyError):
+                selected["col1"]
+            self.assertEqual(selected.contents.dtype.names, ("JDutc", "col2"))
+            self.assertFalse(os.path.isfile(path + ".npy")) # only whole tables are stored as binary copies
+
+            output = EmulationOutput(path)
+            self.assertEqual(len(output.names), 20)
+            column = output["col2"]
+            self.assertIsNone(output._contents) # read on its own
+            self.assertTrue(np.allclose(column, selected["col2"], rtol=1e-6))
+
+            chunks = list(output.iter_chunks(3))
+            self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 3, 1])
+            self.assertTrue((np.concatenate(chunks) == output.contents).all())
+            self.assertTrue((output["col2"] == column).all())
+            self.assertTrue(os.path.isfile(path + ".npy"))
+
+            reloaded = EmulationOutput(path, columns=["col2"])
+            self.assertTrue((reloaded["col2"] == column).all())
+            self.assertTrue((reloaded.contents["col2"] == column).all())
+
+
+    def test_emulate_timeout(self):
+        print("Running a test fit with a time limit of 5s")
+        with self.assertRaises(PexoProcessError) as context:
+            Pexo(verbose=False).run(
+                mode="fit",
+                primary="HD239960",
+                Niter=100000,
+                limits=ResourceLimits(timeout=5, nice=10, tail=5)
+            )
+        self.assertIsNotNone(context.exception.timeout)
+        self.assertLessEqual(len(context.exception.tail), 5)
+
+
+    def test_emulate_async(self):
+        print("Running two concurrent test emulations with asyncio, this should take <1min")
+        pexo = Pexo(verbose=False)
+
+        async def emulate_twice():
+            return await asyncio.gather(*[
+                pexo.run_async(mode="emulate", primary="HD128621", ins="HARPS", time=time)
+                for time in ["2450000 2451000 10", "2451000 2452000 10"]
+            ])
+
+        for output in asyncio.get_event_loop().run_until_complete(emulate_twice()):
+            self.assertIsInstance(output, EmulationOutput)
+
+
+    def test_emulate_cache(self):
+        print("Running a test emulation twice with a result cache, this should take <1min")
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResultCache(folder=folder)
+            for _ in range(2):
+                output = Pexo(verbose=False).run(
+                    mode="emulate",
+                    primary="HD128621",
+                    ins="HARPS",
+                    time=[2450000, 2450010, 2450020],
+                    cache=cache
+                )
+                self.assertIsInstance(output, EmulationOutput)
+
+            self.assertEqual(cache.stats["hits"], 1)
+            self.assertEqual(cache.stats["misses"], 1)
+
+
+    def test_cache_entries(self):
+        print("Running stub emulations with a result cache and checking its entries")
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResultCache(folder=folder)
+            pexo = stub_pexo()
+            for _ in range(2):
+                pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010], cache=cache)
+            pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010, 2450020], cache=cache, incremental=True)
+
+            stats = cache.stats
+            self.assertEqual((stats["hits"], stats["misses"]), (1, 2))
+            self.assertEqual((stats["epoch_hits"], stats["epoch_misses"]), (0, 1))
+            self.assertEqual(stats["entries"], 2) # the output with its binary copy, and the cached epochs
+            self.assertEqual(stats["size"], sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder)))
+
+            cache.clear()
+            self.assertEqual(os.listdir(folder), [])
+
+
+    def test_emulate_incremental(self):
+        print("Running a test emulation and extending its time grid, this should take <1min")
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResultCache(folder=folder)
+            pexo = Pexo(verbose=False)
+            first = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010, 2450020], cache=cache, incremental=True)
+            second = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450000, 2450010, 2450020, 2450030], cache=cache, incremental=True)
+
+            self.assertEqual(len(second.contents), 4)
+            for name in first.contents.dtype.names:
+                self.assertTrue((second.contents[name][:3] == first.contents[name]).all())
+
+
+    def test_incremental_epochs(self):
+        print("Matching and merging tables of emulated epochs, and extending a stub emulation with new epochs")
+        known = epoch_rows([2450020, 2450000, 2450010])
+        table = np.array([(2.0,), (0.0,), (1.0,)], dtype=[("value", float)])
+        index, found = match_epochs(known, epoch_rows([2450010, 2450005, 2450020]))
+        self.assertEqual(found.tolist(), [True, False, True])
+        self.assertEqual(index[found].tolist(), [2, 0])
+        self.assertFalse(match_epochs(np.empty((0, 1)), epoch_rows([2450000]))[1].any())
+        self.assertFalse(match_epochs(known, epoch_rows([2450010 + 1e-9]))[1].any()) # compared exactly
+
+        epochs, merged = merge_epochs(known, table, epoch_rows([2450005, 2450010]), np.array([(0.5,), (1.0,)], dtype=table.dtype))
+        self.assertEqual(epochs[:, 0].tolist(), [2450000, 2450005, 2450010, 2450020])
+        self.assertEqual(merged["value"].tolist(), [0.0, 0.5, 1.0, 2.0])
+
+        split = epoch_rows([[2450000, 0.5], [2449999, 1.5], [2450000, 0.25], [2450000, 0.5]]) # sorted by the whole JD, then by its parts
+        epochs, merged = merge_epochs(split, np.arange(4))
+        self.assertEqual(epochs.tolist(), [[2450000, 0.25], [2449999, 1.5], [2450000, 0.5]])
+        self.assertEqual(merged.tolist(), [2, 1, 0])
+
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResultCache(folder=folder)
+            pexo = stub_pexo()
+            first = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450020, 2450000, 2450010], cache=cache, incremental=True)
+            second = pexo.run(mode="emulate", primary="HD128621", ins="HARPS", time=[2450030, 2450010, 2450000], cache=cache, incremental=True)
+            self.assertEqual(second.contents["JDutc"].tolist(), [2450030, 2450010, 2450000])
+            self.assertEqual(second.contents[1:].tolist(), first.contents[[2, 1]].tolist()) # the stub's random columns are only equal if reused
+            self.assertEqual((cache.stats["epoch_hits"], cache.stats["epoch_misses"]), (1, 1))
+
+
+    def test_sweep(self):
+        print("Running a sweep of test emulations over two .par parameters, this should take <2min")
+        sweep = Sweep.grid(dict(BinaryModel="none"), RefType=["none", "refro"], TtTdbMethod=["eph", "FB01"])
+        table = sweep.run(Pexo(verbose=False), max_workers=2, primary="HD128621", ins="HARPS", time=[2450000, 2450010, 2450020])
+
+        self.assertEqual(len(sweep), 4)
+        self.assertEqual(len(table), 4 * 3)
+        self.assertEqual(sorted(set(table["RefType"])), ["none", "refro"])
+
+
+    def test_fit_multichain(self):
+        print("Running two test fits for HD239960 as independent chains, this should take <2min")
+        output = Pexo(verbose=False).fit_multichain(
+            n_chains=2,
+            seeds=[1, 2],
+            primary="HD239960",
+            Niter=100,
+            ncore=2
+        )
+        self.assertIsInstance(output, MultiChainFit)
+        self.assertEqual(len(output), 2)
+        self.assertEqual(output.chains().shape[0], 2)
+        self.assertEqual(len(output.summary().rhat), len(output.parameters))
+
+
+    def test_convergence_diagnostics(self):
+        print("Computing split R-hat and effective sample sizes of synthetic chains")
+        random = np.random.RandomState(0)
+        iid = random.normal(size=(4, 1000, 3)) # (chain, sample, parameter)
+        self.assertTrue(np.all(np.abs(split_rhat(iid) - 1) < 0.01))
+        self.assertTrue(np.all(np.abs(effective_sample_size(iid) / 4000 - 1) < 0.25))
+
+        # AR(1) chains with phi = 0.9: 4000 draws are worth 4000 * (1 - phi) / (1 + phi) = 210 independent ones
+        noise = random.normal(size=(4, 1000, 2))
+        ar = np.empty_like(noise)
+        ar[:, 0] = noise[:, 0] / np.sqrt(1 - 0.9**2)
+        for i in range(1, ar.shape[1]):
+            ar[:, i] = 0.9 * ar[:, i - 1] + noise[:, i]
+        self.assertTrue(np.all(np.abs(effective_sample_size(ar) / 210 - 1) < 0.3))
+
+        shifted = iid.copy()
+        shifted[0] += 2 # one chain stuck elsewhere
+        self.assertGreater(split_rhat(shifted)[0], 1.1)
+        self.assertTrue(np.all(np.isnan(split_rhat(iid[:, :3]))))
+        self.assertTrue(np.all(np.isnan(effective_sample_size(iid[:, :3]))))
+
+
+    def test_fit_export(self):
+        print("Running a test fit for HD239960 and exporting it, this should take <2min")
+        output = Pexo(verbose=False).run(
+            mode="fit",
+            primary="HD239960",
+            Niter=100,
+            ncore=4
+        )
+        model = output.model
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "fit.npz")
+            output.export(path, compress=False)
+            exported = FitOutput.open(path)
+
+            self.assertIs(output.model, model)
+            self.assertEqual(sorted(exported.model.dictionary), sorted(model.dictionary))
+            self.assertEqual(exported.parameters, output.parameters)
+            self.assertTrue((exported.chain() == output.chain()).all())
+
+            stacked = stack_parstat([output, exported])
+            self.assertEqual(stacked.shape, (2, len(output.parstat), len(output.parstat.table.dtype.names)))
+            self.assertTrue((stacked[0] == stacked[1]).all())
+
+
+    def test_fit_collection(self):
+        print("Running two test fits for HD239960 and loading them as a collection, this should take <3min")
+        pexo = Pexo(verbose=False)
+        with tempfile.TemporaryDirectory() as folder:
+            paths = [os.path.join(folder, "fit{}.Robj".format(i)) for i in range(2)]
+            for path in paths:
+                pexo.run(mode="fit", primary="HD239960", Niter=100, ncore=2, out=path)
+
+            index = os.path.join(folder, "index")
+            collection = FitCollection.from_paths(paths + [os.path.join(folder, "missing.Robj")], workers=2, thin=2, index=index)
+            self.assertEqual(len(collection), 2)
+            self.assertEqual(len(collection.errors), 1)
+            self.assertEqual(collection.parstat().shape[0], 2)
+
+            reloaded = FitCollection.from_paths(paths, index=index, thin=2, parts=["ParStat"])
+            self.assertTrue((reloaded.parstat() == collection.parstat()).all())
+
+
 if __name__ == "__main__":
     unittest.main()